@@ -3,10 +3,12 @@ import os
 import streamlit as st
 from dotenv import load_dotenv
 from database import db, ChatSession, Message, MentorStyle
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Sequence, Iterator, Mapping
 import time
 import json
+from functools import lru_cache
 from logging_config import logger, log_ai_interaction, log_performance
+from semantic_cache import semantic_cache
 
 # Load environment variables from .env file
 load_dotenv()
@@ -14,6 +16,15 @@ load_dotenv()
 # Define the model
 MODEL = "gemini-2.5-flash"
 
+# Fallback texts returned to the UI, defined once instead of per call
+DEFAULT_STUDENT_CONTEXT = "Student is learning programming concepts."
+NEW_CONVERSATION_CONTEXT = "New conversation - no prior context."
+NO_STYLE_EXAMPLES = "No style examples available. Please provide mentor style examples."
+REPLY_ERROR_MESSAGE = "Sorry, I encountered an error while generating a reply. Please try again."
+
+# Very short openers like "hi" carry too little meaning to match reliably, so they skip the cache
+MIN_CACHEABLE_LENGTH = 20
+
 def configure_gemini():
     """Configure Google Gemini API"""
     logger.info("Configuring Gemini API")
@@ -36,6 +47,16 @@ def configure_gemini():
 # Configure Gemini API
 configure_gemini()
 
+@lru_cache(maxsize=None)
+def _get_model(system_instruction: Optional[str] = None) -> genai.GenerativeModel:
+    """Return a shared model whose static instructions stay at the front of every request"""
+    return genai.GenerativeModel(MODEL, system_instruction=system_instruction)
+
+def _cached_token_count(response) -> int:
+    """Number of prompt tokens served from Gemini's prefix cache"""
+    usage = getattr(response, "usage_metadata", None)
+    return getattr(usage, "cached_content_token_count", 0) or 0
+
 # System prompt for Student Context Analysis
 SYSTEM_PROMPT_SUMMARIZE_CONTEXT = """You are a Student Context Analyst. Read the entire <CHAT_HISTORY> and output a brief, 1-2 sentence summary of the student's journey.
 
@@ -125,10 +146,8 @@ def summarize_student_journey(chat_history: str) -> str:
 {chat_history}
 </CHAT_HISTORY>"""
         
-        model = genai.GenerativeModel(MODEL)
-        response = model.generate_content(
-            f"{SYSTEM_PROMPT_SUMMARIZE_CONTEXT}\n\n{prompt}"
-        )
+        model = _get_model(SYSTEM_PROMPT_SUMMARIZE_CONTEXT)
+        response = model.generate_content(prompt)
         
         duration = time.time() - start_time
         logger.info(f"Student journey summarized", duration=f"{duration:.3f}s", summary_length=len(response.text))
@@ -138,79 +157,135 @@ def summarize_student_journey(chat_history: str) -> str:
     except Exception as e:
         duration = time.time() - start_time
         logger.error(f"Error summarizing student journey", error=str(e), duration=f"{duration:.3f}s")
-        return "Student is learning programming concepts."
+        return DEFAULT_STUDENT_CONTEXT
 
-def invoke_reply_agent(mentor_id: str, student_message: str, session_id: str, 
-                      mentor_style: Optional[str] = None, student_context: Optional[str] = None) -> str:
-    """Generate a reply to a student message in the mentor's style with context awareness"""
-    start_time = time.time()
-    logger.info(f"Generating AI reply", 
-               mentor_id=mentor_id, session_id=session_id, 
-               message_length=len(student_message))
+def _resolve_mentor_style(mentor_id: str, mentor_style: Optional[str]) -> str:
+    """Return the provided mentor style or load the latest one from the database"""
+    if mentor_style:
+        return mentor_style
     
-    try:
-        # Get mentor style from database if not provided
-        if not mentor_style:
-            logger.debug("Retrieving mentor style from database", mentor_id=mentor_id)
-            mentor_style_data = db.get_mentor_style(mentor_id)
-            if mentor_style_data:
-                mentor_style = "\n".join(mentor_style_data.sample_messages)
-                logger.debug("Mentor style retrieved", 
-                           style_confidence=mentor_style_data.confidence_score)
-            else:
-                mentor_style = "No style examples available. Please provide mentor style examples."
-                logger.warning("No mentor style found in database", mentor_id=mentor_id)
-        
-        # Get chat history from database
-        logger.debug("Retrieving chat history", session_id=session_id)
-        chat_history = db.get_session_context(session_id)
-        
-        # Summarize student journey if not provided
-        if not student_context and chat_history:
-            logger.debug("Summarizing student journey from chat history")
-            student_context = summarize_student_journey(chat_history)
-        elif not student_context:
-            student_context = "New conversation - no prior context."
-        
-        prompt_content = f"""<MENTOR_STYLE_EXAMPLES>
+    logger.debug("Retrieving mentor style from database", mentor_id=mentor_id)
+    mentor_style_data = db.get_mentor_style(mentor_id)
+    if mentor_style_data:
+        logger.debug("Mentor style retrieved", 
+                   style_confidence=mentor_style_data.confidence_score)
+        return "\n".join(mentor_style_data.sample_messages)
+    
+    logger.warning("No mentor style found in database", mentor_id=mentor_id)
+    return NO_STYLE_EXAMPLES
+
+def _build_reply_prompt(mentor_id: str, student_message: str, chat_history: str,
+                        mentor_style: Optional[str], student_context: Optional[str]) -> str:
+    """Assemble the reply request from style, chat history and student context"""
+    mentor_style = _resolve_mentor_style(mentor_id, mentor_style)
+    
+    # Summarize student journey if not provided
+    if not student_context and chat_history:
+        logger.debug("Summarizing student journey from chat history")
+        student_context = summarize_student_journey(chat_history)
+    elif not student_context:
+        student_context = NEW_CONVERSATION_CONTEXT
+    
+    # Keep the parts that are stable across turns (style, append-only history) at the
+    # front so Gemini's implicit prefix cache can reuse them; per-call parts go last
+    prompt_content = f"""<MENTOR_STYLE_EXAMPLES>
 {mentor_style}
 </MENTOR_STYLE_EXAMPLES>
 
-<STUDENT_CONTEXT_SUMMARY>
-{student_context}
-</STUDENT_CONTEXT_SUMMARY>
-
 <CHAT_HISTORY>
 {chat_history}
 </CHAT_HISTORY>
 
+<STUDENT_CONTEXT_SUMMARY>
+{student_context}
+</STUDENT_CONTEXT_SUMMARY>
+
 <NEW_STUDENT_MESSAGE>
 {student_message}
 </NEW_STUDENT_MESSAGE>"""
-        
-        logger.debug("Calling Gemini API for reply generation", 
-                   prompt_length=len(prompt_content))
-        
-        model = genai.GenerativeModel(MODEL)
-        response = model.generate_content(
-            f"{SYSTEM_PROMPT_REPLY}\n\n{prompt_content}"
-        )
-        
-        duration = time.time() - start_time
-        log_performance("AI_REPLY_GENERATION", duration, {
-            "mentor_id": mentor_id,
-            "session_id": session_id,
-            "response_length": len(response.text)
-        })
-        
-        log_ai_interaction(mentor_id, session_id, "REPLY_GENERATION", {
+    
+    logger.debug("Calling Gemini API for reply generation", 
+               prompt_length=len(prompt_content))
+    return prompt_content
+
+def _log_reply_generated(mentor_id: str, session_id: str, student_message: str,
+                         response_text: str, start_time: float, cached_tokens: int = 0):
+    """Record performance and interaction metrics for a generated reply"""
+    duration = time.time() - start_time
+    log_performance("AI_REPLY_GENERATION", duration, {
+        "mentor_id": mentor_id,
+        "session_id": session_id,
+        "response_length": len(response_text)
+    })
+    
+    log_ai_interaction(mentor_id, session_id, "REPLY_GENERATION", {
+        "student_message_length": len(student_message),
+        "response_length": len(response_text),
+        "cached_tokens": cached_tokens,
+        "duration": duration
+    })
+    
+    logger.info(f"AI reply generated successfully", 
+               duration=f"{duration:.3f}s", response_length=len(response_text))
+
+def _lookup_cached_reply(mentor_id: str, session_id: str, chat_history: str,
+                         student_message: str) -> tuple:
+    """Embed the student message and return (cache key, embedding, cached reply or None)"""
+    # Only a session's opening message is self-contained: its reply depends on nothing but
+    # the mentor's style and the message, so it can be shared across sessions. Later turns
+    # skip the cache entirely and do not pay for an embedding call.
+    if chat_history or len(student_message.strip()) < MIN_CACHEABLE_LENGTH:
+        return None, None, None
+    
+    mentor_style_data = db.get_mentor_style(mentor_id)
+    cache_key = (mentor_id, mentor_style_data.id if mentor_style_data else "")
+    
+    embedding = semantic_cache.embed(student_message)
+    if embedding is None:
+        return None, None, None
+    
+    cached_reply = semantic_cache.lookup(cache_key, embedding)
+    if cached_reply:
+        log_ai_interaction(mentor_id, session_id, "REPLY_CACHE_HIT", {
             "student_message_length": len(student_message),
-            "response_length": len(response.text),
-            "duration": duration
+            "response_length": len(cached_reply)
         })
-        
-        logger.info(f"AI reply generated successfully", 
-                   duration=f"{duration:.3f}s", response_length=len(response.text))
+    return cache_key, embedding, cached_reply
+
+def _get_chat_history(session_id: str) -> str:
+    """Load the formatted chat history for a session"""
+    logger.debug("Retrieving chat history", session_id=session_id)
+    return db.get_session_context(session_id)
+
+def invoke_reply_agent(mentor_id: str, student_message: str, session_id: str, 
+                      mentor_style: Optional[str] = None, student_context: Optional[str] = None) -> str:
+    """Generate a reply to a student message in the mentor's style with context awareness"""
+    start_time = time.time()
+    logger.info(f"Generating AI reply", 
+               mentor_id=mentor_id, session_id=session_id, 
+               message_length=len(student_message))
+    
+    try:
+        chat_history = _get_chat_history(session_id)
+        
+        # Near-duplicate opening questions reuse an earlier reply in the same mentor style
+        cache_key, embedding, cached_reply = None, None, None
+        if not mentor_style and not student_context:
+            cache_key, embedding, cached_reply = _lookup_cached_reply(
+                mentor_id, session_id, chat_history, student_message)
+        if cached_reply:
+            return cached_reply
+        
+        prompt = _build_reply_prompt(mentor_id, student_message, chat_history,
+                                     mentor_style, student_context)
+        
+        model = _get_model(SYSTEM_PROMPT_REPLY)
+        response = model.generate_content(prompt)
+        
+        _log_reply_generated(mentor_id, session_id, student_message, response.text, start_time,
+                             _cached_token_count(response))
+        if embedding is not None:
+            semantic_cache.add(cache_key, embedding, response.text)
         return response.text
         
     except Exception as e:
@@ -219,52 +294,143 @@ def invoke_reply_agent(mentor_id: str, student_message: str, session_id: str,
                     mentor_id=mentor_id, session_id=session_id, 
                     error=str(e), duration=f"{duration:.3f}s")
         st.error(f"Error generating reply: {str(e)}")
-        return "Sorry, I encountered an error while generating a reply. Please try again."
+        return REPLY_ERROR_MESSAGE
 
-def invoke_nudge_agent(mentor_id: str, event_description: str, 
-                      mentor_style: Optional[str] = None) -> str:
-    """Generate a proactive nudge message based on an event"""
+def invoke_reply_agent_stream(mentor_id: str, student_message: str, session_id: str, 
+                             mentor_style: Optional[str] = None, student_context: Optional[str] = None) -> Iterator[str]:
+    """Stream a reply to a student message chunk by chunk as Gemini generates it"""
     start_time = time.time()
-    logger.info(f"Generating nudge message", mentor_id=mentor_id, event=event_description)
+    logger.info(f"Streaming AI reply", 
+               mentor_id=mentor_id, session_id=session_id, 
+               message_length=len(student_message))
     
     try:
-        # Get mentor style from database if not provided
-        if not mentor_style:
-            mentor_style_data = db.get_mentor_style(mentor_id)
-            if mentor_style_data:
-                mentor_style = "\n".join(mentor_style_data.sample_messages)
-            else:
-                mentor_style = "No style examples available. Please provide mentor style examples."
-        
-        prompt_content = f"""<MENTOR_STYLE_EXAMPLES>
+        chat_history = _get_chat_history(session_id)
+        
+        # Near-duplicate opening questions reuse an earlier reply in the same mentor style
+        cache_key, embedding, cached_reply = None, None, None
+        if not mentor_style and not student_context:
+            cache_key, embedding, cached_reply = _lookup_cached_reply(
+                mentor_id, session_id, chat_history, student_message)
+        if cached_reply:
+            yield cached_reply
+            return
+        
+        prompt = _build_reply_prompt(mentor_id, student_message, chat_history,
+                                     mentor_style, student_context)
+        
+        model = _get_model(SYSTEM_PROMPT_REPLY)
+        response = model.generate_content(prompt, stream=True)
+        
+        chunks = []
+        for chunk in response:
+            # The final chunk of a stream may carry only finish metadata
+            if chunk.parts:
+                chunks.append(chunk.text)
+                yield chunk.text
+        
+        full_reply = "".join(chunks)
+        _log_reply_generated(mentor_id, session_id, student_message, full_reply, start_time,
+                             _cached_token_count(response))
+        if embedding is not None and full_reply:
+            semantic_cache.add(cache_key, embedding, full_reply)
+        
+    except Exception as e:
+        duration = time.time() - start_time
+        logger.error(f"Error streaming AI reply", 
+                    mentor_id=mentor_id, session_id=session_id, 
+                    error=str(e), duration=f"{duration:.3f}s")
+        # Let the caller discard whatever part of the reply was already streamed and report it
+        raise
+
+def _build_nudge_prompt(mentor_id: str, event_description: str, mentor_style: Optional[str]) -> str:
+    """Assemble the nudge request for a trigger event"""
+    mentor_style = _resolve_mentor_style(mentor_id, mentor_style)
+    
+    prompt_content = f"""<MENTOR_STYLE_EXAMPLES>
 {mentor_style}
 </MENTOR_STYLE_EXAMPLES>
 
 <TRIGGER_EVENT>
 {event_description}
 </TRIGGER_EVENT>"""
+    
+    return prompt_content
+
+def _log_nudge_generated(mentor_id: str, response_text: str, start_time: float, cached_tokens: int = 0):
+    """Record performance metrics for a generated nudge"""
+    duration = time.time() - start_time
+    log_performance("AI_NUDGE_GENERATION", duration, {
+        "mentor_id": mentor_id,
+        "response_length": len(response_text),
+        "cached_tokens": cached_tokens
+    })
+    
+    logger.info(f"Nudge generated successfully", duration=f"{duration:.3f}s")
+
+def invoke_nudge_agent(mentor_id: str, event_description: str, 
+                      mentor_style: Optional[str] = None) -> str:
+    """Generate a proactive nudge message based on an event"""
+    start_time = time.time()
+    logger.info(f"Generating nudge message", mentor_id=mentor_id, event=event_description)
+    
+    try:
+        prompt = _build_nudge_prompt(mentor_id, event_description, mentor_style)
         
-        model = genai.GenerativeModel(MODEL)
-        response = model.generate_content(
-            f"{SYSTEM_PROMPT_NUDGE}\n\n{prompt_content}"
-        )
-        
-        duration = time.time() - start_time
-        log_performance("AI_NUDGE_GENERATION", duration, {
-            "mentor_id": mentor_id,
-            "response_length": len(response.text)
-        })
+        model = _get_model(SYSTEM_PROMPT_NUDGE)
+        response = model.generate_content(prompt)
         
-        logger.info(f"Nudge generated successfully", duration=f"{duration:.3f}s")
+        _log_nudge_generated(mentor_id, response.text, start_time, _cached_token_count(response))
         return response.text
         
     except Exception as e:
         duration = time.time() - start_time
         logger.error(f"Error generating nudge", mentor_id=mentor_id, error=str(e), duration=f"{duration:.3f}s")
-        st.error(f"Error generating nudge: {str(e)}")
-        return "Sorry, I encountered an error while generating a nudge. Please try again."
+        # Runs on a worker thread where st.error would be dropped; the UI reports it from the future
+        raise
+
+# JSON fields extracted by the "Analyst" agent for every mentor style
+STYLE_JSON_FIELDS = """{
+  "formality": "casual (uses 'hey', 'yeah', 'gonna') or formal (uses 'greetings', 'acknowledged', 'proceed')",
+  "tone": "encouraging (uses praise, 'you got this!') or direct (no-nonsense, factual) or socratic (asks guiding questions)",
+  "emoji_usage": "none, rare (1-2 per message), or frequent (in almost every message)",
+  "punctuation_style": "Uses exclamation points frequently! or Uses periods only. or Uses ellipses... often. or Mixed punctuation",
+  "greeting_examples": ["exact greetings found in text", "e.g., 'Hey there!'", "'Hi,'"],
+  "sign_off_examples": ["exact sign-offs found", "e.g., 'You got this!'", "'Keep it up!'"],
+  "common_phrases": ["unique recurring words or phrases", "e.g., 'No worries'", "'Think of it like...'", "'Let's break it down'"]
+}"""
+
+def _parse_json_response(response_text: str):
+    """Strip markdown code fences from a model response and parse it as JSON"""
+    response_text = response_text.strip()
+    
+    # Remove any markdown formatting if present
+    if response_text.startswith("```json"):
+        response_text = response_text.replace("```json", "").replace("```", "").strip()
+    elif response_text.startswith("```"):
+        response_text = response_text.replace("```", "").strip()
+    
+    logger.debug(f"Raw AI response: {response_text}")
+    return json.loads(response_text)
 
-def analyze_mentor_style(mentor_id: str, sample_messages: List[str]) -> Dict:
+def _fill_missing_style_fields(style_data: Dict) -> Dict:
+    """Ensure a style analysis has every field downstream code expects"""
+    required_fields = ["tone", "common_phrases", "emoji_usage", "message_length", 
+                      "greeting_style", "sign_off_style", "punctuation_style", "encouragement_level"]
+    
+    for field in required_fields:
+        if field not in style_data:
+            logger.warning(f"Missing field in style analysis: {field}")
+            style_data[field] = "unknown"
+    return style_data
+
+def save_analyzed_style(mentor_id: str, style_data: Dict, sample_messages: Sequence[str],
+                        confidence_score: float = 0.8):
+    """Persist a style analysis as the mentor's active style"""
+    db.save_mentor_style(mentor_id, style_data, sample_messages, confidence_score)
+    semantic_cache.clear(mentor_id)
+
+def analyze_mentor_style(mentor_id: str, sample_messages: Sequence[str]) -> Dict:
     """Analyze mentor's communication style from sample messages using concrete text patterns"""
     start_time = time.time()
     logger.info(f"Analyzing mentor style", mentor_id=mentor_id, sample_count=len(sample_messages))
@@ -282,48 +448,20 @@ def analyze_mentor_style(mentor_id: str, sample_messages: List[str]) -> Dict:
 
 Analyze and return ONLY a valid JSON object with these exact fields:
 
-{{
-  "formality": "casual (uses 'hey', 'yeah', 'gonna') or formal (uses 'greetings', 'acknowledged', 'proceed')",
-  "tone": "encouraging (uses praise, 'you got this!') or direct (no-nonsense, factual) or socratic (asks guiding questions)",
-  "emoji_usage": "none, rare (1-2 per message), or frequent (in almost every message)",
-  "punctuation_style": "Uses exclamation points frequently! or Uses periods only. or Uses ellipses... often. or Mixed punctuation",
-  "greeting_examples": ["exact greetings found in text", "e.g., 'Hey there!'", "'Hi,'"],
-  "sign_off_examples": ["exact sign-offs found", "e.g., 'You got this!'", "'Keep it up!'"],
-  "common_phrases": ["unique recurring words or phrases", "e.g., 'No worries'", "'Think of it like...'", "'Let's break it down'"]
-}}
+{STYLE_JSON_FIELDS}
 
 Focus ONLY on what you literally see in the text. Do not interpret or abstract.
 Return ONLY the JSON object, no explanations."""
         
-        model = genai.GenerativeModel(MODEL)
+        model = _get_model()
         response = model.generate_content(analysis_prompt)
         
-        # Clean the response text
-        response_text = response.text.strip()
-        
-        # Remove any markdown formatting if present
-        if response_text.startswith("```json"):
-            response_text = response_text.replace("```json", "").replace("```", "").strip()
-        elif response_text.startswith("```"):
-            response_text = response_text.replace("```", "").strip()
-        
-        logger.debug(f"Raw AI response: {response_text}")
-        
-        # Parse JSON response
-        style_data = json.loads(response_text)
-        
-        # Validate the response has required fields
-        required_fields = ["tone", "common_phrases", "emoji_usage", "message_length", 
-                          "greeting_style", "sign_off_style", "punctuation_style", "encouragement_level"]
-        
-        for field in required_fields:
-            if field not in style_data:
-                logger.warning(f"Missing field in style analysis: {field}")
-                style_data[field] = "unknown"
+        # Parse JSON response and validate the required fields
+        style_data = _fill_missing_style_fields(_parse_json_response(response.text))
         
         # Save to database
         confidence_score = 0.8
-        db.save_mentor_style(mentor_id, style_data, sample_messages, confidence_score)
+        save_analyzed_style(mentor_id, style_data, sample_messages, confidence_score)
         
         duration = time.time() - start_time
         log_performance("STYLE_ANALYSIS", duration, {
@@ -338,8 +476,7 @@ Return ONLY the JSON object, no explanations."""
     except json.JSONDecodeError as e:
         duration = time.time() - start_time
         logger.error(f"JSON parsing error in style analysis", mentor_id=mentor_id, error=str(e), 
-                    response_text=response_text if 'response_text' in locals() else "No response", 
-                    duration=f"{duration:.3f}s")
+                    response_text=e.doc, duration=f"{duration:.3f}s")
         
         # Return a default style if JSON parsing fails
         default_style = {
@@ -354,12 +491,58 @@ Return ONLY the JSON object, no explanations."""
         }
         
         # Save default style to database
-        db.save_mentor_style(mentor_id, default_style, sample_messages, 0.5)
+        save_analyzed_style(mentor_id, default_style, sample_messages, 0.5)
         return default_style
         
     except Exception as e:
         duration = time.time() - start_time
         logger.error(f"Error analyzing mentor style", mentor_id=mentor_id, error=str(e), duration=f"{duration:.3f}s")
-        st.error(f"Error analyzing mentor style: {str(e)}")
-        return {}
+        # Runs on a worker thread where st.error would be dropped; the UI reports it from the future
+        raise
+
+def analyze_mentor_styles_batch(mentor_id: str, samples_by_type: Mapping[str, Sequence[str]]) -> Dict[str, Dict]:
+    """Analyze several mentor personalities in a single LLM call, keyed by personality type"""
+    start_time = time.time()
+    logger.info(f"Analyzing mentor styles in batch", mentor_id=mentor_id, style_count=len(samples_by_type))
+    
+    try:
+        mentor_blocks = "\n\n".join(
+            f"<MENTOR_MESSAGES type=\"{mentor_type}\">\n" + "\n".join(samples) + "\n</MENTOR_MESSAGES>"
+            for mentor_type, samples in samples_by_type.items()
+        )
+        
+        analysis_prompt = f"""You are a meticulous Communication Pattern Analyzer. Your only job is to read each <MENTOR_MESSAGES> block and output a valid JSON object that captures each mentor's literal communication patterns.
+
+{mentor_blocks}
+
+Return ONLY a valid JSON object whose keys are the exact `type` attributes above and whose values are JSON objects with these exact fields:
 
+{STYLE_JSON_FIELDS}
+
+Focus ONLY on what you literally see in the text. Do not interpret or abstract.
+Return ONLY the JSON object, no explanations."""
+        
+        model = _get_model()
+        response = model.generate_content(analysis_prompt)
+        
+        batch_data = _parse_json_response(response.text)
+        styles = {
+            mentor_type: _fill_missing_style_fields(batch_data[mentor_type])
+            for mentor_type in samples_by_type
+            if isinstance(batch_data.get(mentor_type), dict)
+        }
+        
+        duration = time.time() - start_time
+        log_performance("STYLE_ANALYSIS_BATCH", duration, {
+            "mentor_id": mentor_id,
+            "style_count": len(styles)
+        })
+        
+        logger.info(f"Batch style analysis completed", duration=f"{duration:.3f}s", style_count=len(styles))
+        return styles
+        
+    except Exception as e:
+        duration = time.time() - start_time
+        logger.error(f"Error analyzing mentor styles in batch", mentor_id=mentor_id, error=str(e), duration=f"{duration:.3f}s")
+        st.error(f"Error analyzing mentor styles: {str(e)}")
+        return {}
@@ -4,11 +4,9 @@ Communication Style Mimicking Agent for Mentor-Student Messaging System
 """
 import streamlit as st
 import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from agents import (
-    invoke_reply_agent, 
-    analyze_mentor_style
-)
+from typing import Dict, Iterator, List, Mapping, Optional, Tuple
 from database import db
 from logging_config import logger, log_user_action, log_ai_interaction
 
@@ -19,241 +17,405 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# Sample messages for each mentor personality, based on best teaching methodologies
+_MENTOR_SAMPLES: Mapping[str, Tuple[str, ...]] = {
+    "Encouraging Mentor": (
+        "Great question! 😊 This shows you're thinking critically. Let me build on what you already know - can you tell me what you've tried so far?",
+        "You're making excellent progress! 👏 I can see you understand the foundation. Now, let's connect this to the next concept.",
+        "I appreciate your effort here. Let's use the Socratic method - what do you think might happen if we approach it this way? 💭",
+        "This is a common challenge, and asking about it shows real learning. Let's break it into smaller, manageable pieces. ✨",
+        "You've demonstrated good understanding of the basics. Now let's scaffold up to the more complex parts together! 🚀"
+    ),
+    
+    "Direct Mentor": (
+        "Let's apply Bloom's Taxonomy here. First, understand the concept. Then, we'll apply it to solve real problems.",
+        "Here's the core principle. Practice this pattern: understand, apply, analyze. Let's start with a concrete example.",
+        "Focus on mastery learning. We won't move forward until you've fully grasped this foundation. Let's verify your understanding.",
+        "Let me demonstrate this using worked examples. Watch how I approach it, then you'll try with guided practice.",
+        "The key is deliberate practice with immediate feedback. Try this problem, and I'll show you exactly where to improve."
+    ),
+    
+    "Academic Mentor": (
+        "Let us apply constructivist principles here. What prior knowledge can we activate to build upon?",
+        "Consider the zone of proximal development: this challenge is slightly beyond your current level, which means optimal growth.",
+        "Let us use metacognitive strategies. As we work through this, I shall model my thinking process explicitly.",
+        "From a pedagogical perspective, we should employ spaced repetition. Let us review the foundation before adding complexity.",
+        "Using cognitive load theory, let us chunk this information. We shall tackle each piece sequentially to avoid overwhelm."
+    ),
+    
+    "Casual Mentor": (
+        "Let's think about this together. What's your intuition telling you? Often your first instinct points us in the right direction.",
+        "Makes sense? Let's use an analogy you already know... think of it like a recipe. Now apply that logic here.",
+        "I'll show you a real-world example first. Once you see it in action, the abstract concept will click. Trust me on this.",
+        "Let's do some active learning. Instead of me explaining everything, try it yourself and I'll guide you if you get stuck.",
+        "Good question! Before I answer, let me ask you something that'll help you discover it yourself - what patterns do you notice?"
+    )
+}
+
+# Demo conversation history for each mentor personality
+_DEMO_CONVERSATIONS: Mapping[str, Tuple[Dict[str, str], ...]] = {
+    "Encouraging Mentor": (
+        {"sender": "student", "content": "Hi... I'm supposed to start the Python basics but I'm completely lost. I've never coded before and feel really stupid."},
+        {"sender": "mentor", "content": "Hey there! Please don't feel that way! 😊 Seriously, everyone feels that way at the start. It's like learning a new language! I'm here to help you every step of the way. Let's start with just one tiny thing: a 'variable'. Sound good?"},
+        {"sender": "student", "content": "ok, i guess. what is it?"},
+        {"sender": "mentor", "content": "Awesome! ✨ A variable is just a box. You can put things in it. Let's make a box called `my_name` and put your name in it. Can you try to write what that might look like?"},
+        {"sender": "student", "content": "my_name = 'John'?"},
+        {"sender": "mentor", "content": "YES! You got it on the first try! 🚀 That's exactly it. See? You're already coding! Now, how would you make a new box called `my_age` and put your age in it?"},
+        {"sender": "student", "content": "my_age = 30"},
+        {"sender": "mentor", "content": "Perfect! You're on a roll. 👍 Now you have two 'boxes'. What do you think happens if you want to see what's inside the `my_name` box?"},
+        {"sender": "student", "content": "print(my_name)?"},
+        {"sender": "mentor", "content": "You got it! 👏 You're a natural at this. Okay, I think you've mastered variables. Let's take a break, great work today!"}
+    ),
+    
+    "Direct Mentor": (
+        {"sender": "student", "content": "How do I use a dictionary to store user data?"},
+        {"sender": "mentor", "content": "Your query is premature. We have not covered foundational data structures. You cannot build a roof before the foundation is laid. We will begin with lists."},
+        {"sender": "student", "content": "oh. okay. what's a list?"},
+        {"sender": "mentor", "content": "A list is an ordered, mutable collection of items. Use square brackets []. Create a list named `student_names` containing 'Alice', 'Bob', and 'Charlie'. Show me the code."},
+        {"sender": "student", "content": "student_names = ['Alice', 'Bob', 'Charlie']"},
+        {"sender": "mentor", "content": "Correct. Now, how do you access the second item in that list?"},
+        {"sender": "student", "content": "student_names[2]?"},
+        {"sender": "mentor", "content": "Incorrect. That is the third item. Indexing begins at 0. Try again."},
+        {"sender": "student", "content": "student_names[1]"},
+        {"sender": "mentor", "content": "Correct. You have demonstrated understanding of list creation and indexing. You may now proceed to dictionaries."}
+    ),
+    
+    "Academic Mentor": (
+        {"sender": "student", "content": "I need help with functions in Python."},
+        {"sender": "mentor", "content": "Let us establish the theoretical foundation first. From a computational perspective, a function is an abstraction mechanism that encapsulates reusable logic. What is your current understanding of modular programming?"},
+        {"sender": "student", "content": "I'm not sure what that means."},
+        {"sender": "mentor", "content": "Understood. Let us apply constructivist principles. Consider what you know about mathematical functions: f(x) = 2x. The function takes an input and produces an output. This same paradigm applies in programming."},
+        {"sender": "student", "content": "So a function takes input and gives output?"},
+        {"sender": "mentor", "content": "Precisely. Now, let us examine the syntax. In Python, we use the `def` keyword followed by the function name and parameters. I shall model this: `def greet(name): return f'Hello, {name}'`. Do you observe the structure?"},
+        {"sender": "student", "content": "Yes, it starts with def, then the name, then parentheses."},
+        {"sender": "mentor", "content": "Excellent observation. You have identified the syntactic pattern. Now, applying zone of proximal development, create a function that takes two numbers and returns their sum."}
+    ),
+    
+    "Casual Mentor": (
+        {"sender": "student", "content": "I'm stuck on this loop thing."},
+        {"sender": "mentor", "content": "Alright, let's tackle this together. What's your intuition telling you about what a loop might do? Take a guess."},
+        {"sender": "student", "content": "Maybe it repeats something?"},
+        {"sender": "mentor", "content": "Exactly! That's it. A loop is just code that repeats. Think of it like a playlist that keeps playing songs over and over. Makes sense?"},
+        {"sender": "student", "content": "Yeah, I think so."},
+        {"sender": "mentor", "content": "Cool. So here's a real example... say you want to print 'Hello' five times. Instead of writing print('Hello') five times, you write a loop. Want to see it?"},
+        {"sender": "student", "content": "Yes please."},
+        {"sender": "mentor", "content": "Alright: `for i in range(5): print('Hello')`. That's it. The `range(5)` means 'do this 5 times'. Now you try - write a loop that prints your name 3 times."}
+    )
+}
+
+# Number of most recent chat messages rendered per "Load older messages" page
+CHAT_PAGE_SIZE = 20
+
+# Latest messages rendered as full chat bubbles; older ones share one markdown block
+RECENT_CHAT_BUBBLES = 5
+
+# Session state keys and their initial values
+_DEFAULT_SESSION_STATE: Tuple[Tuple[str, object], ...] = (
+    ("current_session_id", None),
+    ("current_mentor_id", "mentor_001"),
+    ("student_id", "student_001"),
+    ("msg_version", 0),
+    ("chat_history_limit", CHAT_PAGE_SIZE),
+)
+
+@st.cache_resource
+def _background_pool() -> ThreadPoolExecutor:
+    """Worker threads shared by all sessions for LLM calls that should not block a rerun"""
+    return ThreadPoolExecutor(max_workers=4)
+
 # Initialize session state
 def init_session_state():
     """Initialize session state variables"""
-    defaults = {
-        "current_session_id": None,
-        "current_mentor_id": "mentor_001",
-        "student_id": "student_001"
-    }
-    
-    for key, value in defaults.items():
+    for key, value in _DEFAULT_SESSION_STATE:
         if key not in st.session_state:
             st.session_state[key] = value
 
+# Entries are invalidated by msg_version; ttl/max_entries only bound memory for stale keys
+@st.cache_data(ttl=300, max_entries=100, show_spinner=False)
+def _cached_session_messages(session_id: str, msg_version: int, limit: int) -> list:
+    """Fetch the latest session messages, reusing the result until msg_version is bumped"""
+    return db.get_last_n_messages(session_id, limit)
+
+def _bump_message_version():
+    """Invalidate cached session messages after a message is stored"""
+    st.session_state.msg_version += 1
+
+def _queue_message(pending: List[tuple], sender_type: str, content: str, is_ai_generated: bool = False,
+                   approval_status: str = "approved"):
+    """Stage a message to be written by _flush_messages"""
+    pending.append((sender_type, content, is_ai_generated, approval_status))
+
+def _flush_messages(session_id: str, pending: List[tuple]) -> List[str]:
+    """Write all staged messages in one transaction and return their ids"""
+    if not pending:
+        return []
+    message_ids = db.add_messages_bulk(session_id, pending)
+    pending.clear()
+    _bump_message_version()
+    return message_ids
+
+def _guarded_stream(chunks: Iterator[str], errors: List[Exception]) -> Iterator[str]:
+    """Yield reply chunks, recording a generation failure instead of raising it into st.write_stream"""
+    try:
+        yield from chunks
+    except Exception as e:
+        errors.append(e)
+
+def _maybe_rerun(changed: bool):
+    """Rerun only when the triggering action actually changed state"""
+    if changed:
+        st.rerun()
+
+def _get_current_session():
+    """Return the active ChatSession, refetching it only when the session id changes"""
+    session_id = st.session_state.current_session_id
+    if not session_id:
+        return None
+    
+    session = st.session_state.get("current_session_obj")
+    if session is None or session.id != session_id:
+        session = db.get_session(session_id)
+        st.session_state.current_session_obj = session
+    return session
+
 def render_sidebar():
     """Render simplified sidebar"""
+    # Fragments cannot open st.sidebar themselves, so enter it first
     with st.sidebar:
-        st.header("🎯 AI Style Mimicking System")
-        
-        # Mentor ID
-        mentor_id = st.text_input(
-            "Mentor ID", 
-            value=st.session_state.get("current_mentor_id", "mentor_001"),
-            help="Your unique mentor identifier"
-        )
-        st.session_state.current_mentor_id = mentor_id
-        
-        st.divider()
-        
-        # Style Analysis
-        st.subheader("🎨 Style Analysis")
-        
-        # Mentor personality selection
-        mentor_type = st.selectbox(
-            "Choose Mentor Personality:",
-            ["Encouraging Mentor", "Direct Mentor", "Academic Mentor", "Casual Mentor"],
-            help="Select a mentor personality type to analyze"
-        )
-        
-        if st.button("Analyze Style", help="Analyze the selected mentor's communication patterns"):
-            analyze_mentor_style_ui(mentor_id, mentor_type)
-        
-        st.divider()
-        
-        # Session Management
-        st.subheader("💬 Session Management")
-        
-        col1, col2 = st.columns(2)
-        with col1:
-            if st.button("🆕 New Session", help="Start a new chat session"):
-                create_new_session()
-        
-        with col2:
-            if st.button("📚 Load Demo", help="Load a demo conversation to analyze"):
-                load_demo_conversation(mentor_id, mentor_type)
-        
-        # Show current session info
-        if st.session_state.get("current_session_id"):
-            session = db.get_session(st.session_state.get("current_session_id"))
-            if session:
-                st.info(f"**Active Session:** {session.student_id}")
-        
+        _render_sidebar_fragment()
+
+@st.fragment
+def _render_sidebar_fragment():
+    """Sidebar controls; widget interactions here rerun only this fragment"""
+    st.header("🎯 AI Style Mimicking System")
+    
+    # Mentor ID
+    # Keyed to session state, so the widget stores the value itself
+    mentor_id = st.text_input(
+        "Mentor ID", 
+        key="current_mentor_id",
+        help="Your unique mentor identifier"
+    )
+    
+    st.divider()
+    
+    # Style Analysis
+    st.subheader("🎨 Style Analysis")
+    
+    # Mentor personality selection
+    mentor_type = st.selectbox(
+        "Choose Mentor Personality:",
+        ["Encouraging Mentor", "Direct Mentor", "Academic Mentor", "Casual Mentor"],
+        help="Select a mentor personality type to analyze"
+    )
+    
+    if st.button("Analyze Style", help="Analyze the selected mentor's communication patterns",
+                 disabled="_style_job" in st.session_state):
+        analyze_mentor_style_ui(mentor_id, mentor_type)
+    
+    if "_style_job" in st.session_state:
+        # Poll only while an analysis is running, without rerunning the rest of the sidebar
+        st.fragment(_render_style_progress, run_every="1s")()
+    
+    if "style_result" in st.session_state:
+        _show_style_result(*st.session_state.pop("style_result"))
+    
+    if st.button("Analyze All Personalities", help="Analyze every mentor personality in a single request"):
+        analyze_all_mentor_styles_ui(mentor_id)
+    
+    st.divider()
+    
+    # Session Management
+    st.subheader("💬 Session Management")
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        if st.button("🆕 New Session", help="Start a new chat session"):
+            create_new_session()
+    
+    with col2:
+        if st.button("📚 Load Demo", help="Load a demo conversation to analyze"):
+            load_demo_conversation(mentor_id, mentor_type)
+    
+    # Show current session info
+    session = _get_current_session()
+    if session:
+        st.info(f"**Active Session:** {session.student_id}")
+    
+    st.divider()
+    
+    # Event Simulation
+    st.subheader("🎯 Event Simulation")
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        if st.button("🐍 Python", help="Simulate Python exam"):
+            simulate_exam(mentor_id, "Python Basics Final")
+    
+    with col2:
+        if st.button("📐 Math", help="Simulate Math exam"):
+            simulate_exam(mentor_id, "Algebra Fundamentals")
+    
+    if st.button("⚡ Simulate Both", help="Simulate both exams concurrently"):
+        simulate_exams(mentor_id, ["Python Basics Final", "Algebra Fundamentals"])
+    
+    # Show generated nudge if available
+    if 'generated_nudge' in st.session_state and st.session_state.generated_nudge:
         st.divider()
+        st.subheader("💬 Generated Nudge")
+        st.write(st.session_state.generated_nudge)
         
-        # Event Simulation
-        st.subheader("🎯 Event Simulation")
-        col1, col2 = st.columns(2)
-        
-        with col1:
-            if st.button("🐍 Python", help="Simulate Python exam"):
-                simulate_exam(mentor_id, "Python Basics Final")
-        
-        with col2:
-            if st.button("📐 Math", help="Simulate Math exam"):
-                simulate_exam(mentor_id, "Algebra Fundamentals")
-        
-        # Show generated nudge if available
-        if 'generated_nudge' in st.session_state and st.session_state.generated_nudge:
-            st.divider()
-            st.subheader("💬 Generated Nudge")
-            st.write(st.session_state.generated_nudge)
-            
-            if st.session_state.get("current_session_id"):
-                if st.button("✅ Add to Session"):
-                    db.add_message(
-                        st.session_state.get("current_session_id"), 
+        if st.session_state.current_session_id:
+            if st.button("✅ Add to Session"):
+                try:
+                    message_id = db.add_message(
+                        st.session_state.current_session_id, 
                         'ai', 
                         st.session_state.generated_nudge, 
                         is_ai_generated=True, 
                         approval_status='approved'
                     )
+                    _bump_message_version()
                     st.success("✅ Nudge added!")
                     del st.session_state.generated_nudge
-                    st.rerun()
-            else:
-                st.warning("⚠️ No active session")
+                except Exception as e:
+                    message_id = None
+                    logger.error(f"Error adding nudge to session", 
+                                session_id=st.session_state.current_session_id, error=str(e))
+                    st.error(f"❌ Failed to add nudge: {str(e)}")
+                _maybe_rerun(message_id is not None)
+        else:
+            st.warning("⚠️ No active session")
 
 def analyze_mentor_style_ui(mentor_id: str, mentor_type: str):
     """UI for mentor style analysis"""
+    # Deferred so the Gemini SDK is only imported once an agent is actually needed
+    from agents import analyze_mentor_style, save_analyzed_style
+    
     log_user_action(mentor_id, "STYLE_ANALYSIS_REQUEST", {"mentor_type": mentor_type})
     
-    with st.spinner(f"Analyzing {mentor_type} communication style..."):
-        # Get sample messages based on mentor type
-        sample_messages = get_mentor_sample_messages(mentor_type)
-        
-        style_data = analyze_mentor_style(mentor_id, sample_messages)
+    # Get sample messages based on mentor type
+    sample_messages = get_mentor_sample_messages(mentor_type)
+    
+    cached_style = st.session_state.get("all_styles", {}).get(mentor_type)
+    if cached_style:
+        # Reuse the batch analysis instead of another LLM round-trip
+        save_analyzed_style(mentor_id, cached_style, sample_messages)
+        _show_style_result(mentor_id, mentor_type, cached_style)
+        return
+    
+    # Run the LLM call on a worker thread so the sidebar stays responsive
+    future = _background_pool().submit(analyze_mentor_style, mentor_id, sample_messages)
+    st.session_state._style_job = (mentor_id, mentor_type, future)
+    st.rerun(scope="fragment")
+
+def _render_style_progress():
+    """Poll the background style analysis and hand its result to the sidebar once done"""
+    mentor_id, mentor_type, future = st.session_state._style_job
+    if not future.done():
+        st.info(f"⏳ Analyzing {mentor_type} communication style...")
+        return
+    
+    del st.session_state._style_job
+    error = future.exception()
+    style_data = {} if error else future.result()
+    st.session_state.style_result = (mentor_id, mentor_type, style_data, error)
+    st.rerun()
+
+def _show_style_result(mentor_id: str, mentor_type: str, style_data: Dict,
+                       error: Optional[BaseException] = None):
+    """Display and log the outcome of a mentor style analysis"""
+    if style_data:
+        log_user_action(mentor_id, "STYLE_ANALYSIS_SUCCESS", {
+            "mentor_type": mentor_type,
+            "style_characteristics": list(style_data.keys())
+        })
+        st.success(f"✅ {mentor_type} style analyzed successfully!")
+        st.json(style_data)
+    else:
+        log_user_action(mentor_id, "STYLE_ANALYSIS_FAILED", {
+            "mentor_type": mentor_type,
+            "error": str(error) if error else None
+        })
+        st.error(f"❌ Failed to analyze style: {str(error)}" if error else "❌ Failed to analyze style")
+
+def analyze_all_mentor_styles_ui(mentor_id: str):
+    """UI for analyzing every mentor personality in one batched request"""
+    from agents import analyze_mentor_styles_batch
+    
+    log_user_action(mentor_id, "STYLE_ANALYSIS_BATCH_REQUEST", {"mentor_types": list(_MENTOR_SAMPLES)})
+    
+    with st.spinner("Analyzing all mentor personalities..."):
+        styles = analyze_mentor_styles_batch(mentor_id, _MENTOR_SAMPLES)
         
-        if style_data:
-            log_user_action(mentor_id, "STYLE_ANALYSIS_SUCCESS", {
-                "mentor_type": mentor_type,
-                "style_characteristics": list(style_data.keys())
-            })
-            st.success(f"✅ {mentor_type} style analyzed successfully!")
-            st.json(style_data)
+        if styles:
+            st.session_state.all_styles = styles
+            log_user_action(mentor_id, "STYLE_ANALYSIS_BATCH_SUCCESS", {"mentor_types": list(styles)})
+            st.success(f"✅ Analyzed {len(styles)} mentor personalities! Choose one and click Analyze Style to apply it.")
         else:
-            log_user_action(mentor_id, "STYLE_ANALYSIS_FAILED", {"mentor_type": mentor_type})
-            st.error("❌ Failed to analyze style")
+            log_user_action(mentor_id, "STYLE_ANALYSIS_BATCH_FAILED", {"mentor_types": list(_MENTOR_SAMPLES)})
+            st.error("❌ Failed to analyze mentor personalities")
 
-def get_mentor_sample_messages(mentor_type: str) -> list:
+def get_mentor_sample_messages(mentor_type: str) -> Tuple[str, ...]:
     """Get sample messages for different mentor personality types based on best teaching methodologies"""
-    
-    mentor_samples = {
-        "Encouraging Mentor": [
-            "Great question! 😊 This shows you're thinking critically. Let me build on what you already know - can you tell me what you've tried so far?",
-            "You're making excellent progress! 👏 I can see you understand the foundation. Now, let's connect this to the next concept.",
-            "I appreciate your effort here. Let's use the Socratic method - what do you think might happen if we approach it this way? 💭",
-            "This is a common challenge, and asking about it shows real learning. Let's break it into smaller, manageable pieces. ✨",
-            "You've demonstrated good understanding of the basics. Now let's scaffold up to the more complex parts together! 🚀"
-        ],
-        
-        "Direct Mentor": [
-            "Let's apply Bloom's Taxonomy here. First, understand the concept. Then, we'll apply it to solve real problems.",
-            "Here's the core principle. Practice this pattern: understand, apply, analyze. Let's start with a concrete example.",
-            "Focus on mastery learning. We won't move forward until you've fully grasped this foundation. Let's verify your understanding.",
-            "Let me demonstrate this using worked examples. Watch how I approach it, then you'll try with guided practice.",
-            "The key is deliberate practice with immediate feedback. Try this problem, and I'll show you exactly where to improve."
-        ],
-        
-        "Academic Mentor": [
-            "Let us apply constructivist principles here. What prior knowledge can we activate to build upon?",
-            "Consider the zone of proximal development: this challenge is slightly beyond your current level, which means optimal growth.",
-            "Let us use metacognitive strategies. As we work through this, I shall model my thinking process explicitly.",
-            "From a pedagogical perspective, we should employ spaced repetition. Let us review the foundation before adding complexity.",
-            "Using cognitive load theory, let us chunk this information. We shall tackle each piece sequentially to avoid overwhelm."
-        ],
-        
-        "Casual Mentor": [
-            "Let's think about this together. What's your intuition telling you? Often your first instinct points us in the right direction.",
-            "Makes sense? Let's use an analogy you already know... think of it like a recipe. Now apply that logic here.",
-            "I'll show you a real-world example first. Once you see it in action, the abstract concept will click. Trust me on this.",
-            "Let's do some active learning. Instead of me explaining everything, try it yourself and I'll guide you if you get stuck.",
-            "Good question! Before I answer, let me ask you something that'll help you discover it yourself - what patterns do you notice?"
-        ]
-    }
-    
-    return mentor_samples.get(mentor_type, mentor_samples["Encouraging Mentor"])
+    return _MENTOR_SAMPLES.get(mentor_type, _MENTOR_SAMPLES["Encouraging Mentor"])
+
+def _exam_event_description(exam_type: str) -> str:
+    """Build the trigger event description for a simulated exam"""
+    return f"Event: 'student took exam', Exam: '{exam_type}', Date: '2024-10-23', Student: 'student_001', Score: 'Pending'"
+
+def _generate_exam_nudges(mentor_id: str, exam_types: list) -> List[Tuple[Optional[str], Optional[BaseException]]]:
+    """Generate one nudge per exam concurrently on the background pool, as (nudge, error) pairs"""
+    from agents import invoke_nudge_agent
+    futures = [
+        _background_pool().submit(invoke_nudge_agent, mentor_id, _exam_event_description(exam_type))
+        for exam_type in exam_types
+    ]
+    # st.error is dropped on worker threads, so the caller reports each failure itself
+    return [(None, future.exception()) if future.exception() else (future.result(), None)
+            for future in futures]
 
 def simulate_exam(mentor_id: str, exam_type: str):
     """Simulate a student taking an exam and generate a nudge"""
-    log_user_action(mentor_id, "EXAM_SIMULATION_REQUEST", {"exam_type": exam_type})
+    simulate_exams(mentor_id, [exam_type])
+
+def simulate_exams(mentor_id: str, exam_types: list):
+    """Simulate students taking one or more exams and generate their nudges in parallel"""
+    for exam_type in exam_types:
+        log_user_action(mentor_id, "EXAM_SIMULATION_REQUEST", {"exam_type": exam_type})
     
-    with st.spinner(f"Simulating {exam_type} exam..."):
-        # Create exam event description
-        event_description = f"Event: 'student took exam', Exam: '{exam_type}', Date: '2024-10-23', Student: 'student_001', Score: 'Pending'"
+    exam_label = " & ".join(exam_types)
+    with st.spinner(f"Simulating {exam_label} exam..."):
+        # Generate all nudges on worker threads so the LLM calls overlap
+        nudge_results = _generate_exam_nudges(mentor_id, exam_types)
         
-        # Generate nudge using the nudge agent
-        from agents import invoke_nudge_agent
-        nudge_message = invoke_nudge_agent(mentor_id, event_description)
+        successful_nudges = []
+        for exam_type, (nudge_message, error) in zip(exam_types, nudge_results):
+            if nudge_message:
+                log_user_action(mentor_id, "EXAM_SIMULATION_SUCCESS", {
+                    "exam_type": exam_type,
+                    "nudge_length": len(nudge_message)
+                })
+                successful_nudges.append(nudge_message)
+            else:
+                log_user_action(mentor_id, "EXAM_SIMULATION_FAILED", {
+                    "exam_type": exam_type,
+                    "error": str(error) if error else None
+                })
+                st.error(f"❌ Failed to generate {exam_type} nudge: {str(error)}" if error
+                         else f"❌ Failed to generate {exam_type} nudge")
         
-        if nudge_message and not nudge_message.startswith("Sorry, I encountered an error"):
-            log_user_action(mentor_id, "EXAM_SIMULATION_SUCCESS", {
-                "exam_type": exam_type,
-                "nudge_length": len(nudge_message)
-            })
-            
-            st.success(f"🎯 {exam_type} exam simulation completed!")
-            st.session_state.generated_nudge = nudge_message
-            st.rerun()
-        else:
-            log_user_action(mentor_id, "EXAM_SIMULATION_FAILED", {"exam_type": exam_type})
-            st.error("❌ Failed to generate nudge message")
+        if successful_nudges:
+            st.success(f"🎯 {exam_label} exam simulation completed!")
+            st.session_state.generated_nudge = "\n\n".join(successful_nudges)
+            # The nudge is also drawn further down this run, so skip the rerun when it
+            # would wipe the error shown for a failed exam
+            if len(successful_nudges) == len(exam_types):
+                st.rerun(scope="fragment")
 
-def get_demo_conversations(mentor_type: str) -> list:
+def get_demo_conversations(mentor_type: str) -> Tuple[Dict[str, str], ...]:
     """Get demo conversation history based on mentor type"""
-    
-    demo_conversations = {
-        "Encouraging Mentor": [
-            {"sender": "student", "content": "Hi... I'm supposed to start the Python basics but I'm completely lost. I've never coded before and feel really stupid."},
-            {"sender": "mentor", "content": "Hey there! Please don't feel that way! 😊 Seriously, everyone feels that way at the start. It's like learning a new language! I'm here to help you every step of the way. Let's start with just one tiny thing: a 'variable'. Sound good?"},
-            {"sender": "student", "content": "ok, i guess. what is it?"},
-            {"sender": "mentor", "content": "Awesome! ✨ A variable is just a box. You can put things in it. Let's make a box called `my_name` and put your name in it. Can you try to write what that might look like?"},
-            {"sender": "student", "content": "my_name = 'John'?"},
-            {"sender": "mentor", "content": "YES! You got it on the first try! 🚀 That's exactly it. See? You're already coding! Now, how would you make a new box called `my_age` and put your age in it?"},
-            {"sender": "student", "content": "my_age = 30"},
-            {"sender": "mentor", "content": "Perfect! You're on a roll. 👍 Now you have two 'boxes'. What do you think happens if you want to see what's inside the `my_name` box?"},
-            {"sender": "student", "content": "print(my_name)?"},
-            {"sender": "mentor", "content": "You got it! 👏 You're a natural at this. Okay, I think you've mastered variables. Let's take a break, great work today!"}
-        ],
-        
-        "Direct Mentor": [
-            {"sender": "student", "content": "How do I use a dictionary to store user data?"},
-            {"sender": "mentor", "content": "Your query is premature. We have not covered foundational data structures. You cannot build a roof before the foundation is laid. We will begin with lists."},
-            {"sender": "student", "content": "oh. okay. what's a list?"},
-            {"sender": "mentor", "content": "A list is an ordered, mutable collection of items. Use square brackets []. Create a list named `student_names` containing 'Alice', 'Bob', and 'Charlie'. Show me the code."},
-            {"sender": "student", "content": "student_names = ['Alice', 'Bob', 'Charlie']"},
-            {"sender": "mentor", "content": "Correct. Now, how do you access the second item in that list?"},
-            {"sender": "student", "content": "student_names[2]?"},
-            {"sender": "mentor", "content": "Incorrect. That is the third item. Indexing begins at 0. Try again."},
-            {"sender": "student", "content": "student_names[1]"},
-            {"sender": "mentor", "content": "Correct. You have demonstrated understanding of list creation and indexing. You may now proceed to dictionaries."}
-        ],
-        
-        "Academic Mentor": [
-            {"sender": "student", "content": "I need help with functions in Python."},
-            {"sender": "mentor", "content": "Let us establish the theoretical foundation first. From a computational perspective, a function is an abstraction mechanism that encapsulates reusable logic. What is your current understanding of modular programming?"},
-            {"sender": "student", "content": "I'm not sure what that means."},
-            {"sender": "mentor", "content": "Understood. Let us apply constructivist principles. Consider what you know about mathematical functions: f(x) = 2x. The function takes an input and produces an output. This same paradigm applies in programming."},
-            {"sender": "student", "content": "So a function takes input and gives output?"},
-            {"sender": "mentor", "content": "Precisely. Now, let us examine the syntax. In Python, we use the `def` keyword followed by the function name and parameters. I shall model this: `def greet(name): return f'Hello, {name}'`. Do you observe the structure?"},
-            {"sender": "student", "content": "Yes, it starts with def, then the name, then parentheses."},
-            {"sender": "mentor", "content": "Excellent observation. You have identified the syntactic pattern. Now, applying zone of proximal development, create a function that takes two numbers and returns their sum."}
-        ],
-        
-        "Casual Mentor": [
-            {"sender": "student", "content": "I'm stuck on this loop thing."},
-            {"sender": "mentor", "content": "Alright, let's tackle this together. What's your intuition telling you about what a loop might do? Take a guess."},
-            {"sender": "student", "content": "Maybe it repeats something?"},
-            {"sender": "mentor", "content": "Exactly! That's it. A loop is just code that repeats. Think of it like a playlist that keeps playing songs over and over. Makes sense?"},
-            {"sender": "student", "content": "Yeah, I think so."},
-            {"sender": "mentor", "content": "Cool. So here's a real example... say you want to print 'Hello' five times. Instead of writing print('Hello') five times, you write a loop. Want to see it?"},
-            {"sender": "student", "content": "Yes please."},
-            {"sender": "mentor", "content": "Alright: `for i in range(5): print('Hello')`. That's it. The `range(5)` means 'do this 5 times'. Now you try - write a loop that prints your name 3 times."}
-        ]
-    }
-    
-    return demo_conversations.get(mentor_type, demo_conversations["Encouraging Mentor"])
+    return _DEMO_CONVERSATIONS.get(mentor_type, _DEMO_CONVERSATIONS["Encouraging Mentor"])
 
 def load_demo_conversation(mentor_id: str, mentor_type: str):
     """Load a demo conversation to demonstrate context awareness"""
@@ -263,16 +425,17 @@ def load_demo_conversation(mentor_id: str, mentor_type: str):
         # Create new session
         session_id = db.create_session(mentor_id, "demo_student")
         st.session_state.current_session_id = session_id
+        st.session_state.chat_history_limit = CHAT_PAGE_SIZE
         
         # Get demo conversation
         demo_messages = get_demo_conversations(mentor_type)
         
-        # Load all messages into the session
-        for msg in demo_messages:
-            sender_type = msg["sender"]
-            content = msg["content"]
-            is_ai = (sender_type == "mentor")
-            db.add_message(session_id, sender_type, content, is_ai_generated=is_ai, approval_status="approved")
+        # Load all messages into the session in a single transaction
+        db.add_messages_bulk(session_id, [
+            (msg["sender"], msg["content"], msg["sender"] == "mentor", "approved")
+            for msg in demo_messages
+        ])
+        _bump_message_version()
         
         st.success(f"✅ Loaded {len(demo_messages)} messages from {mentor_type} demo!")
         st.info("💡 Now try chatting! The AI will respond in this mentor's style and remember the conversation context.")
@@ -285,25 +448,61 @@ def create_new_session():
     
     log_user_action(mentor_id, "SESSION_CREATED", {"student_id": student_id})
     
-    session_id = db.create_session(mentor_id, student_id)
-    st.session_state.current_session_id = session_id
+    try:
+        session_id = db.create_session(mentor_id, student_id)
+        st.session_state.current_session_id = session_id
+        st.session_state.chat_history_limit = CHAT_PAGE_SIZE
+        st.success("✅ New session created!")
+    except Exception as e:
+        session_id = None
+        logger.error(f"Error creating session", mentor_id=mentor_id, student_id=student_id, error=str(e))
+        st.error(f"❌ Failed to create session: {str(e)}")
     
-    st.success("✅ New session created!")
-    st.rerun()
+    # Keep the error visible instead of rerunning it away
+    _maybe_rerun(session_id is not None)
+
+@st.fragment
+def render_chat_area():
+    """Render chat history and input as a fragment that reruns independently of the sidebar"""
+    render_chat_messages()
+    # New turns are drawn here, below the history and above the input box
+    response_slot = st.container()
+    render_chat_input(response_slot)
+
+def _load_older_messages():
+    """Show one more page of chat history"""
+    st.session_state.chat_history_limit += CHAT_PAGE_SIZE
 
 def render_chat_messages():
     """Render chat messages for current session"""
-    if not st.session_state.get("current_session_id"):
+    if not st.session_state.current_session_id:
         st.info("👆 Create a session in the sidebar to start chatting")
         return
     
-    messages = db.get_session_messages(st.session_state.get("current_session_id"))
+    # Fetch one row past the page to know whether older messages exist
+    limit = st.session_state.chat_history_limit
+    messages = _cached_session_messages(
+        st.session_state.current_session_id, st.session_state.msg_version, limit + 1
+    )
     
     if not messages:
         st.info("💬 No messages yet. Start the conversation!")
         return
     
-    for message in messages:
+    if len(messages) > limit:
+        st.button("⬆️ Load older messages", on_click=_load_older_messages)
+        messages = messages[1:]
+    
+    # One markdown element for older history instead of a bubble per message
+    older, recent = messages[:-RECENT_CHAT_BUBBLES], messages[-RECENT_CHAT_BUBBLES:]
+    if older:
+        st.markdown("\n\n".join(
+            f"**{message.sender_icon}**: {message.content}"
+            for message in older
+        ))
+        st.divider()
+    
+    for message in recent:
         if message.sender_type == "student":
             with st.chat_message("user"):
                 st.write(message.content)
@@ -313,14 +512,15 @@ def render_chat_messages():
                 if message.is_ai_generated:
                     st.caption("🤖 AI Generated")
 
-def render_chat_input():
+def render_chat_input(response_slot):
     """Render chat input and handle messages"""
     if prompt := st.chat_input("Type your message..."):
-        handle_student_message(prompt)
+        with response_slot:
+            handle_student_message(prompt)
 
 def handle_student_message(message: str):
-    """Handle incoming student message"""
-    session_id = st.session_state.get("current_session_id")
+    """Handle incoming student message, drawing the new turn in place"""
+    session_id = st.session_state.current_session_id
     mentor_id = st.session_state.current_mentor_id
     student_id = st.session_state.student_id
     
@@ -330,48 +530,58 @@ def handle_student_message(message: str):
         return
     
     # Log student message
-    log_user_action(student_id, "MESSAGE_SENT", {
+    log_user_action(student_id, "MESSAGE_SENT", lambda: {
         "session_id": session_id,
         "message_length": len(message)
     })
     
-    # Store student message
-    db.add_message(session_id, "student", message)
-    
-    # Display student message
-    with st.chat_message("user"):
-        st.write(message)
-    
-    # Generate AI-assisted response
-    handle_ai_response(session_id, student_id, mentor_id, message)
-    
-    st.rerun()
+    # Stage student message; it is written together with the AI reply
+    pending = []
+    _queue_message(pending, "student", message)
+    try:
+        # Display student message
+        with st.chat_message("user"):
+            st.write(message)
+        
+        # Generate AI-assisted response; the next rerun picks it up from the history cache
+        handle_ai_response(session_id, student_id, mentor_id, message, pending)
+    finally:
+        # One transaction for this turn, even if it was stopped partway
+        _flush_messages(session_id, pending)
 
-def handle_ai_response(session_id: str, student_id: str, mentor_id: str, message: str):
-    """Handle AI response - direct response"""
-    log_ai_interaction(mentor_id, student_id, "AI_RESPONSE_GENERATED", {
+def handle_ai_response(session_id: str, student_id: str, mentor_id: str, message: str,
+                       pending: List[tuple]):
+    """Handle AI response - direct response, staged into pending for the caller to write"""
+    from agents import invoke_reply_agent_stream
+    
+    log_ai_interaction(mentor_id, student_id, "AI_RESPONSE_GENERATED", lambda: {
         "session_id": session_id
     })
     
     with st.chat_message("assistant"):
-        with st.spinner("AI is generating response..."):
-            ai_response = invoke_reply_agent(mentor_id, message, session_id)
+        # Render chunks as they arrive; write_stream returns the concatenated reply. Generation
+        # errors are caught inside the stream so Streamlit's own stop/rerun exceptions pass through
+        errors = []
+        ai_response = st.write_stream(_guarded_stream(
+            invoke_reply_agent_stream(mentor_id, message, session_id), errors))
+        
+        if errors:
+            # A stream that fails partway must not be saved as an approved reply
+            logger.error(f"Discarding partial AI response", session_id=session_id, error=str(errors[0]))
+            st.error(f"❌ Failed to generate AI response: {str(errors[0])}")
+        elif ai_response:
+            st.caption("🤖 AI Generated")
             
-            if ai_response and not ai_response.startswith("Sorry, I encountered an error"):
-                st.write(ai_response)
-                st.caption("🤖 AI Generated")
-                
-                # Store AI response directly
-                db.add_message(session_id, "ai", ai_response, is_ai_generated=True, approval_status="approved")
-            else:
-                st.error("❌ Failed to generate AI response")
+            # Stage AI response alongside the student message
+            _queue_message(pending, "ai", ai_response, is_ai_generated=True)
+        else:
+            st.error("❌ Failed to generate AI response")
 
 
 def main():
     """Main application function"""
     # Initialize
     init_session_state()
-    db.init_database()
     
     # Header
     st.title("🎓 AI Agent Intern - Technical Assessment")
@@ -385,8 +595,7 @@ def main():
     
     with col2:
         st.subheader("💬 Chat Interface")
-        render_chat_messages()
-        render_chat_input()
+        render_chat_area()
         
 
 if __name__ == "__main__":
@@ -5,13 +5,125 @@ import sqlite3
 import json
 import uuid
 from datetime import datetime
-from typing import List, Dict, Optional, Tuple
-from dataclasses import dataclass, asdict
+from typing import List, Dict, Optional, Tuple, Sequence
+from dataclasses import dataclass, asdict, field
 import os
 import time
+import queue
+import threading
+from collections import deque
+from concurrent.futures import Future
+from itertools import chain
+from contextlib import contextmanager
+from pathlib import Path
 from logging_config import logger, log_database_operation
 
-@dataclass
+# Stay under SQLite's default 999 bound-parameter limit per statement
+MAX_SQL_PARAMS = 900
+
+# Idle read-only connections kept open for getters
+READ_POOL_SIZE = 8
+
+# Column order of the tuples written by add_messages_bulk
+MESSAGE_INSERT_COLUMNS = (
+    "id", "session_id", "sender_type", "content", "is_ai_generated", "approval_status", "created_at"
+)
+
+# SQL statements, defined once so sqlite3's statement cache always sees the same strings
+SQL_INSERT_MESSAGE = """
+    INSERT INTO messages (id, session_id, sender_type, content, is_ai_generated, approval_status, created_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+SQL_INSERT_SESSION = """
+    INSERT INTO chat_sessions (id, student_id, mentor_id, created_at, updated_at)
+    VALUES (?, ?, ?, ?, ?)
+"""
+
+SQL_UPDATE_SESSION_TS = """
+    UPDATE chat_sessions SET updated_at = ? WHERE id = ?
+"""
+
+SQL_SELECT_MESSAGES = """
+    SELECT id, session_id, sender_type, content, is_ai_generated, approval_status, approved_by, created_at
+    FROM messages WHERE session_id = ? ORDER BY created_at ASC, rowid ASC
+"""
+
+SQL_SELECT_LAST_MESSAGES = """
+    SELECT id, session_id, sender_type, content, is_ai_generated, approval_status, approved_by, created_at
+    FROM messages WHERE session_id = ? ORDER BY created_at DESC, rowid DESC LIMIT ?
+"""
+
+SQL_SELECT_SESSION_CONTEXT = """
+    SELECT group_concat(line, char(10)) FROM (
+        SELECT sender_type || ': ' || content AS line
+        FROM messages WHERE session_id = ? AND approval_status = 'approved'
+        ORDER BY created_at ASC, rowid ASC
+    )
+"""
+
+SQL_SELECT_SESSION = """
+    SELECT id, mentor_id, student_id, status, created_at, updated_at
+    FROM chat_sessions WHERE id = ?
+"""
+
+SQL_INSERT_STYLE = """
+    INSERT INTO mentor_styles (id, mentor_id, style_data, sample_messages, analyzed_at, confidence_score)
+    VALUES (?, ?, ?, ?, ?, ?)
+"""
+
+SQL_SELECT_LATEST_STYLE = """
+    SELECT id, mentor_id, style_data, sample_messages, analyzed_at, confidence_score
+    FROM mentor_styles WHERE mentor_id = ? ORDER BY analyzed_at DESC LIMIT 1
+"""
+
+SQL_INSERT_QUEUE = """
+    INSERT INTO ai_response_queue (id, session_id, student_message_id, generated_response, created_at, mentor_id)
+    VALUES (?, ?, ?, ?, ?, COALESCE(?, (SELECT mentor_id FROM chat_sessions WHERE id = ?)))
+"""
+
+SQL_SELECT_PENDING = """
+    SELECT arq.id, arq.session_id, arq.student_message_id, arq.generated_response,
+           arq.created_at, m.content as student_message
+    FROM ai_response_queue arq
+    JOIN messages m ON arq.student_message_id = m.id
+    WHERE arq.mentor_id = ? AND arq.status = 'pending'
+    ORDER BY arq.created_at ASC
+    LIMIT ?
+"""
+
+# Claims a pending response and returns what is needed to post it (SQLite 3.35+)
+SQL_UPDATE_QUEUE_APPROVED_SENT = """
+    UPDATE ai_response_queue SET status = 'sent', approved_at = ?, sent_at = ?
+    WHERE id = ? AND status = 'pending'
+    RETURNING session_id, generated_response
+"""
+
+SQL_UPDATE_QUEUE_REJECTED = """
+    UPDATE ai_response_queue SET status = 'rejected' WHERE id = ?
+"""
+
+def _dump_json(value) -> str:
+    """Serialize to compact JSON, keeping non-ASCII text (e.g. emoji) unescaped"""
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+
+def _uuids(n: int) -> List[str]:
+    """Generate n random UUID4 strings from a single os.urandom call"""
+    buf = os.urandom(16 * n)
+    return [str(uuid.UUID(bytes=buf[i:i + 16], version=4)) for i in range(0, 16 * n, 16)]
+
+def _message_row(cursor: sqlite3.Cursor, row: tuple) -> "Message":
+    """Row factory building a Message straight from a messages SELECT in column order"""
+    return Message(row[0], row[1], row[2], row[3], bool(row[4]), row[5], row[6], row[7])
+
+def _dict_row(cursor: sqlite3.Cursor, row: tuple) -> Dict:
+    """Row factory mapping column names to values"""
+    return {column[0]: value for column, value in zip(cursor.description, row)}
+
+# Chat icon per sender type, resolved once when a Message is built
+SENDER_ICONS = {"student": "👤", "mentor": "👨‍🏫", "ai": "🤖"}
+
+@dataclass(slots=True, frozen=True)
 class ChatSession:
     id: str
     student_id: str
@@ -20,7 +132,7 @@ class ChatSession:
     created_at: str
     updated_at: str
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class Message:
     id: str
     session_id: str
@@ -30,8 +142,16 @@ class Message:
     approval_status: str  # 'pending', 'approved', 'rejected'
     approved_by: Optional[str]
     created_at: str
+    sender_icon: str = field(init=False, repr=False)
+    
+    def __post_init__(self):
+        # Frozen, so the derived field is set through object.__setattr__
+        object.__setattr__(
+            self, "sender_icon",
+            "🤖" if self.is_ai_generated else SENDER_ICONS.get(self.sender_type, "🤖")
+        )
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class MentorStyle:
     id: str
     mentor_id: str
@@ -40,7 +160,7 @@ class MentorStyle:
     analyzed_at: str
     confidence_score: float
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class AIResponseQueue:
     id: str
     session_id: str
@@ -54,69 +174,184 @@ class AIResponseQueue:
 class DatabaseManager:
     def __init__(self, db_path: str = "xandy_learning.db"):
         self.db_path = db_path
+        # One long-lived connection shared by every Streamlit session thread
+        self._conn = self._connect()
+        self._lock = threading.RLock()
+        # Getters read through their own connections so WAL lets them run beside the writer
+        self._read_pool: queue.Queue = queue.Queue(maxsize=READ_POOL_SIZE)
+        # Message batches waiting for the next group commit
+        self._pending_writes: deque = deque()
         self.init_database()
     
+    def _connect(self) -> sqlite3.Connection:
+        """Open the shared connection with a large statement cache and tuned pragmas"""
+        # Every query is a fixed SQL string, so the statement cache skips re-preparing them
+        # isolation_level=None: sqlite3 never opens transactions implicitly; get_connection does
+        conn = sqlite3.connect(self.db_path, timeout=30.0, check_same_thread=False,
+                               isolation_level=None, cached_statements=256)
+        conn.execute("PRAGMA journal_mode=WAL")  # Enable WAL mode for better concurrency
+        conn.execute("PRAGMA synchronous=NORMAL")  # Durable across app crashes in WAL mode; one fewer fsync per commit
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA cache_size=-65536")  # 64 MiB page cache
+        conn.execute("PRAGMA mmap_size=268435456")  # Read pages through a 256 MiB memory map
+        conn.execute("PRAGMA wal_autocheckpoint=1000")
+        conn.execute("PRAGMA busy_timeout=30000")
+        return conn
+    
+    def _connect_reader(self) -> sqlite3.Connection:
+        """Open a read-only connection to the same database file"""
+        uri = f"{Path(self.db_path).resolve().as_uri()}?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, timeout=30.0, check_same_thread=False,
+                               cached_statements=256)
+        conn.execute("PRAGMA mmap_size=268435456")
+        return conn
+    
+    @contextmanager
+    def _reader(self):
+        """Borrow a read-only connection from the pool, opening one if none is idle"""
+        try:
+            conn = self._read_pool.get_nowait()
+        except queue.Empty:
+            conn = self._connect_reader()
+        try:
+            yield conn
+        finally:
+            try:
+                self._read_pool.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+    
+    @contextmanager
+    def get_connection(self):
+        """Yield the shared connection inside an explicit write transaction, serialized across threads"""
+        with self._lock:
+            # Take the write lock up front so a transaction never has to upgrade midway
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+                self._conn.execute("COMMIT")
+            except BaseException:
+                # A failed COMMIT may already have ended the transaction; never mask the original error
+                if self._conn.in_transaction:
+                    try:
+                        self._conn.execute("ROLLBACK")
+                    except sqlite3.Error as rollback_error:
+                        logger.error(f"Error rolling back transaction", error=str(rollback_error))
+                raise
+    
+    @staticmethod
+    def _insert_multi(conn: sqlite3.Connection, table: str, columns: Sequence[str],
+                      rows: Sequence[tuple]):
+        """Insert rows with one multi-row VALUES statement per chunk of MAX_SQL_PARAMS parameters"""
+        placeholder = "(" + ", ".join("?" * len(columns)) + ")"
+        chunk_size = max(1, MAX_SQL_PARAMS // len(columns))
+        
+        for start in range(0, len(rows), chunk_size):
+            chunk = rows[start:start + chunk_size]
+            conn.execute(
+                f"INSERT INTO {table} ({', '.join(columns)}) VALUES " + ", ".join([placeholder] * len(chunk)),
+                list(chain.from_iterable(chunk))
+            )
+    
     def init_database(self):
         """Initialize database with required tables"""
         try:
-            conn = sqlite3.connect(self.db_path, timeout=30.0)
-            conn.execute("PRAGMA journal_mode=WAL")  # Enable WAL mode for better concurrency
-            cursor = conn.cursor()
-            
-            # Create tables
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS chat_sessions (
-                    id TEXT PRIMARY KEY,
-                    student_id TEXT NOT NULL,
-                    mentor_id TEXT NOT NULL,
-                    status TEXT DEFAULT 'active',
-                    created_at TEXT NOT NULL,
-                    updated_at TEXT NOT NULL
-                )
-            ''')
-            
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS messages (
-                    id TEXT PRIMARY KEY,
-                    session_id TEXT NOT NULL,
-                    sender_type TEXT NOT NULL,
-                    content TEXT NOT NULL,
-                    is_ai_generated BOOLEAN DEFAULT FALSE,
-                    approval_status TEXT DEFAULT 'pending',
-                    approved_by TEXT,
-                    created_at TEXT NOT NULL,
-                    FOREIGN KEY (session_id) REFERENCES chat_sessions (id)
-                )
-            ''')
-            
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS mentor_styles (
-                    id TEXT PRIMARY KEY,
-                    mentor_id TEXT NOT NULL,
-                    style_data TEXT NOT NULL,
-                    sample_messages TEXT NOT NULL,
-                    analyzed_at TEXT NOT NULL,
-                    confidence_score REAL
-                )
-            ''')
-            
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS ai_response_queue (
-                    id TEXT PRIMARY KEY,
-                    session_id TEXT NOT NULL,
-                    student_message_id TEXT NOT NULL,
-                    generated_response TEXT NOT NULL,
-                    status TEXT DEFAULT 'pending',
-                    created_at TEXT NOT NULL,
-                    approved_at TEXT,
-                    sent_at TEXT,
-                    FOREIGN KEY (session_id) REFERENCES chat_sessions (id),
-                    FOREIGN KEY (student_message_id) REFERENCES messages (id)
-                )
-            ''')
-            
-            conn.commit()
-            conn.close()
+            with self.get_connection() as conn:
+                # Create tables
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS chat_sessions (
+                        id TEXT PRIMARY KEY,
+                        student_id TEXT NOT NULL,
+                        mentor_id TEXT NOT NULL,
+                        status TEXT DEFAULT 'active',
+                        created_at TEXT NOT NULL,
+                        updated_at TEXT NOT NULL
+                    )
+                ''')
+                
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS messages (
+                        id TEXT PRIMARY KEY,
+                        session_id TEXT NOT NULL,
+                        sender_type TEXT NOT NULL,
+                        content TEXT NOT NULL,
+                        is_ai_generated BOOLEAN DEFAULT FALSE,
+                        approval_status TEXT DEFAULT 'pending',
+                        approved_by TEXT,
+                        created_at TEXT NOT NULL,
+                        FOREIGN KEY (session_id) REFERENCES chat_sessions (id)
+                    )
+                ''')
+                
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS mentor_styles (
+                        id TEXT PRIMARY KEY,
+                        mentor_id TEXT NOT NULL,
+                        style_data TEXT NOT NULL,
+                        sample_messages TEXT NOT NULL,
+                        analyzed_at TEXT NOT NULL,
+                        confidence_score REAL
+                    )
+                ''')
+                
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS ai_response_queue (
+                        id TEXT PRIMARY KEY,
+                        session_id TEXT NOT NULL,
+                        student_message_id TEXT NOT NULL,
+                        generated_response TEXT NOT NULL,
+                        status TEXT DEFAULT 'pending',
+                        created_at TEXT NOT NULL,
+                        approved_at TEXT,
+                        sent_at TEXT,
+                        mentor_id TEXT,
+                        FOREIGN KEY (session_id) REFERENCES chat_sessions (id),
+                        FOREIGN KEY (student_message_id) REFERENCES messages (id)
+                    )
+                ''')
+                
+                # Migrate older databases: copy mentor_id onto queued responses
+                queue_columns = {row[1] for row in conn.execute("PRAGMA table_info(ai_response_queue)")}
+                if "mentor_id" not in queue_columns:
+                    conn.execute("ALTER TABLE ai_response_queue ADD COLUMN mentor_id TEXT")
+                    conn.execute('''
+                        UPDATE ai_response_queue SET mentor_id = (
+                            SELECT mentor_id FROM chat_sessions WHERE id = ai_response_queue.session_id
+                        )
+                    ''')
+                
+                # Serves per-session history reads in (created_at, rowid) order, scanned forwards
+                # or backwards without a sort; replaces the DESC index that still needed one
+                conn.execute("DROP INDEX IF EXISTS idx_messages_session_created")
+                conn.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_messages_session_time
+                    ON messages (session_id, created_at)
+                ''')
+                
+                # Latest style per mentor
+                conn.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_mentor_styles_mentor_time
+                    ON mentor_styles (mentor_id, analyzed_at DESC)
+                ''')
+                
+                # A mentor's pending responses, without joining through chat_sessions
+                conn.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_queue_mentor_pending
+                    ON ai_response_queue (mentor_id, created_at) WHERE status = 'pending'
+                ''')
+                
+                # Superseded by idx_queue_mentor_pending once the queue carries mentor_id;
+                # dropped so they stop costing writes on existing databases
+                conn.execute("DROP INDEX IF EXISTS idx_queue_status_created")
+                conn.execute("DROP INDEX IF EXISTS idx_sessions_mentor")
+                
+                # Gather planner statistics until there are some, then only let SQLite refresh
+                # stale ones; analysis_limit samples large tables instead of scanning them
+                conn.execute("PRAGMA analysis_limit = 400")
+                has_stats = conn.execute(
+                    "SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'"
+                ).fetchone() and conn.execute("SELECT 1 FROM sqlite_stat1 LIMIT 1").fetchone()
+                conn.execute("PRAGMA optimize" if has_stats else "ANALYZE")
             logger.info("Database initialized successfully")
             
         except Exception as e:
@@ -132,16 +367,8 @@ class DatabaseManager:
             session_id = str(uuid.uuid4())
             now = datetime.now().isoformat()
             
-            conn = sqlite3.connect(self.db_path, timeout=30.0)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                INSERT INTO chat_sessions (id, student_id, mentor_id, created_at, updated_at)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (session_id, student_id, mentor_id, now, now))
-            
-            conn.commit()
-            conn.close()
+            with self.get_connection() as conn:
+                conn.execute(SQL_INSERT_SESSION, (session_id, student_id, mentor_id, now, now))
             
             duration = time.time() - start_time
             log_database_operation("CREATE", "chat_sessions", session_id, {
@@ -164,101 +391,133 @@ class DatabaseManager:
     def add_message(self, session_id: str, sender_type: str, content: str, 
                    is_ai_generated: bool = False, approval_status: str = 'approved') -> str:
         """Add a message to a session"""
+        return self.add_messages_bulk(
+            session_id, [(sender_type, content, is_ai_generated, approval_status)]
+        )[0]
+    
+    def add_messages_bulk(self, session_id: str,
+                          messages: Sequence[Tuple[str, str, bool, str]]) -> List[str]:
+        """Add several (sender_type, content, is_ai_generated, approval_status) messages in one transaction"""
         start_time = time.time()
-        logger.info(f"Adding message to session", 
-                   session_id=session_id, sender_type=sender_type, 
-                   is_ai_generated=is_ai_generated, approval_status=approval_status,
-                   content_length=len(content))
+        logger.debug(f"Adding messages to session", 
+                    session_id=session_id, message_count=len(messages))
         
         try:
-            message_id = str(uuid.uuid4())
+            message_ids = _uuids(len(messages))
             now = datetime.now().isoformat()
-            
-            conn = sqlite3.connect(self.db_path, timeout=30.0)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                INSERT INTO messages (id, session_id, sender_type, content, is_ai_generated, approval_status, created_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (message_id, session_id, sender_type, content, is_ai_generated, approval_status, now))
-            
-            # Update session timestamp
-            cursor.execute('''
-                UPDATE chat_sessions SET updated_at = ? WHERE id = ?
-            ''', (now, session_id))
-            
-            conn.commit()
-            conn.close()
+            rows = [
+                (message_id, session_id, sender_type, content, is_ai_generated, approval_status, now)
+                for message_id, (sender_type, content, is_ai_generated, approval_status)
+                in zip(message_ids, messages)
+            ]
+            
+            # Queue the batch, then commit it together with any batches other threads queued meanwhile
+            future = Future()
+            self._pending_writes.append((session_id, now, rows, future))
+            self.flush()
+            future.result()
             
             duration = time.time() - start_time
-            log_database_operation("INSERT", "messages", message_id, {
-                "session_id": session_id,
-                "sender_type": sender_type,
-                "is_ai_generated": is_ai_generated,
-                "approval_status": approval_status,
+            log_database_operation("BULK_INSERT", "messages", session_id, {
+                "message_count": len(rows),
+                "message_ids": message_ids,
+                "sender_types": [message[0] for message in messages],
                 "duration": duration
             })
             
-            logger.info(f"Message added successfully", 
-                       message_id=message_id, duration=f"{duration:.3f}s")
-            return message_id
+            logger.info(f"Messages added successfully", 
+                       message_ids=message_ids, duration=f"{duration:.3f}s")
+            return message_ids
             
         except Exception as e:
             duration = time.time() - start_time
-            logger.error(f"Failed to add message", 
-                        session_id=session_id, sender_type=sender_type, 
+            logger.error(f"Failed to add messages", 
+                        session_id=session_id, message_count=len(messages), 
                         error=str(e), duration=f"{duration:.3f}s")
             raise
     
+    def _write_batches(self, batches: Sequence[tuple]):
+        """Insert the rows of queued message batches and bump their sessions in one transaction"""
+        with self.get_connection() as conn:
+            self._insert_multi(conn, "messages", MESSAGE_INSERT_COLUMNS,
+                               [row for _, _, rows, _ in batches for row in rows])
+            
+            # Update each session's timestamp once per batch
+            conn.executemany(SQL_UPDATE_SESSION_TS,
+                             [(now, session_id) for session_id, now, _, _ in batches])
+    
+    def flush(self):
+        """Commit every queued message batch in a single transaction"""
+        with self._lock:
+            batches = []
+            while self._pending_writes:
+                batches.append(self._pending_writes.popleft())
+            if not batches:
+                return
+            
+            try:
+                try:
+                    self._write_batches(batches)
+                except Exception as e:
+                    if len(batches) == 1:
+                        raise
+                    # One bad batch must not fail the others; retry each in its own transaction
+                    logger.warning(f"Group commit failed, retrying batches individually", 
+                                  batch_count=len(batches), error=str(e))
+                    for batch in batches:
+                        future = batch[-1]
+                        try:
+                            self._write_batches([batch])
+                        except Exception as batch_error:
+                            future.set_exception(batch_error)
+                        else:
+                            future.set_result(None)
+                    return
+            except BaseException as e:
+                # Never leave a caller blocked on an unresolved future
+                for *_, future in batches:
+                    if not future.done():
+                        future.set_exception(e)
+                if not isinstance(e, Exception):
+                    raise
+                return
+            
+            for *_, future in batches:
+                future.set_result(None)
+        
+        if len(batches) > 1:
+            logger.debug(f"Group-committed message batches", batch_count=len(batches))
+    
     def get_session_messages(self, session_id: str) -> List[Message]:
         """Get all messages for a session"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT id, session_id, sender_type, content, is_ai_generated, approval_status, approved_by, created_at
-            FROM messages WHERE session_id = ? ORDER BY created_at ASC
-        ''', (session_id,))
-        
-        messages = []
-        for row in cursor.fetchall():
-            messages.append(Message(
-                id=row[0],
-                session_id=row[1],
-                sender_type=row[2],
-                content=row[3],
-                is_ai_generated=bool(row[4]),
-                approval_status=row[5],
-                approved_by=row[6],
-                created_at=row[7]
-            ))
-        
-        conn.close()
+        with self._reader() as conn:
+            cursor = conn.execute(SQL_SELECT_MESSAGES, (session_id,))
+            cursor.row_factory = _message_row
+            messages = cursor.fetchall()
         return messages
     
+    def get_last_n_messages(self, session_id: str, n: int) -> List[Message]:
+        """Get the latest n messages for a session, oldest first"""
+        with self._reader() as conn:
+            cursor = conn.execute(SQL_SELECT_LAST_MESSAGES, (session_id, n))
+            cursor.row_factory = _message_row
+            rows = cursor.fetchall()
+        
+        rows.reverse()
+        return rows
+    
     def get_session_context(self, session_id: str) -> str:
         """Get formatted chat history for AI context"""
-        messages = self.get_session_messages(session_id)
-        context = []
+        with self._reader() as conn:
+            # Filter and join in SQLite; the ordered subquery fixes group_concat's order
+            row = conn.execute(SQL_SELECT_SESSION_CONTEXT, (session_id,)).fetchone()
         
-        for msg in messages:
-            if msg.approval_status == 'approved':
-                context.append(f"{msg.sender_type}: {msg.content}")
-        
-        return "\n".join(context)
+        return row[0] or ""
     
     def get_session(self, session_id: str) -> Optional[ChatSession]:
         """Get a specific chat session by ID"""
-        conn = sqlite3.connect(self.db_path, timeout=30.0)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT id, mentor_id, student_id, status, created_at, updated_at
-            FROM chat_sessions WHERE id = ?
-        ''', (session_id,))
-        
-        row = cursor.fetchone()
-        conn.close()
+        with self._reader() as conn:
+            row = conn.execute(SQL_SELECT_SESSION, (session_id,)).fetchone()
         
         if row:
             return ChatSession(
@@ -271,37 +530,23 @@ class DatabaseManager:
             )
         return None
     
-    def save_mentor_style(self, mentor_id: str, style_data: Dict, sample_messages: List[str], 
+    def save_mentor_style(self, mentor_id: str, style_data: Dict, sample_messages: Sequence[str], 
                          confidence_score: float) -> str:
         """Save analyzed mentor style"""
         style_id = str(uuid.uuid4())
         now = datetime.now().isoformat()
         
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO mentor_styles (id, mentor_id, style_data, sample_messages, analyzed_at, confidence_score)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (style_id, mentor_id, json.dumps(style_data), json.dumps(sample_messages), now, confidence_score))
-        
-        conn.commit()
-        conn.close()
+        with self.get_connection() as conn:
+            conn.execute(SQL_INSERT_STYLE, (
+                style_id, mentor_id, _dump_json(style_data), _dump_json(sample_messages), now, confidence_score
+            ))
         
         return style_id
     
     def get_mentor_style(self, mentor_id: str) -> Optional[MentorStyle]:
         """Get the latest mentor style analysis"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT id, mentor_id, style_data, sample_messages, analyzed_at, confidence_score
-            FROM mentor_styles WHERE mentor_id = ? ORDER BY analyzed_at DESC LIMIT 1
-        ''', (mentor_id,))
-        
-        row = cursor.fetchone()
-        conn.close()
+        with self._reader() as conn:
+            row = conn.execute(SQL_SELECT_LATEST_STYLE, (mentor_id,)).fetchone()
         
         if row:
             return MentorStyle(
@@ -315,51 +560,24 @@ class DatabaseManager:
         return None
     
     def add_ai_response_to_queue(self, session_id: str, student_message_id: str, 
-                                generated_response: str) -> str:
-        """Add AI-generated response to approval queue"""
+                                generated_response: str, mentor_id: Optional[str] = None) -> str:
+        """Add AI-generated response to approval queue, looking up mentor_id from the session if not given"""
         queue_id = str(uuid.uuid4())
         now = datetime.now().isoformat()
         
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO ai_response_queue (id, session_id, student_message_id, generated_response, created_at)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (queue_id, session_id, student_message_id, generated_response, now))
-        
-        conn.commit()
-        conn.close()
+        with self.get_connection() as conn:
+            conn.execute(SQL_INSERT_QUEUE, (
+                queue_id, session_id, student_message_id, generated_response, now, mentor_id, session_id
+            ))
         
         return queue_id
     
-    def get_pending_ai_responses(self, mentor_id: str) -> List[Dict]:
-        """Get pending AI responses for mentor approval"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT arq.id, arq.session_id, arq.student_message_id, arq.generated_response, 
-                   arq.created_at, m.content as student_message
-            FROM ai_response_queue arq
-            JOIN messages m ON arq.student_message_id = m.id
-            JOIN chat_sessions cs ON arq.session_id = cs.id
-            WHERE cs.mentor_id = ? AND arq.status = 'pending'
-            ORDER BY arq.created_at ASC
-        ''', (mentor_id,))
-        
-        responses = []
-        for row in cursor.fetchall():
-            responses.append({
-                'id': row[0],
-                'session_id': row[1],
-                'student_message_id': row[2],
-                'generated_response': row[3],
-                'created_at': row[4],
-                'student_message': row[5]
-            })
-        
-        conn.close()
+    def get_pending_ai_responses(self, mentor_id: str, limit: Optional[int] = None) -> List[Dict]:
+        """Get pending AI responses for mentor approval, oldest first, at most limit rows"""
+        with self._reader() as conn:
+            cursor = conn.execute(SQL_SELECT_PENDING, (mentor_id, -1 if limit is None else limit))  # SQLite treats a negative LIMIT as unbounded
+            cursor.row_factory = _dict_row
+            responses = cursor.fetchall()
         return responses
     
     def approve_ai_response(self, queue_id: str, mentor_id: str) -> bool:
@@ -370,46 +588,21 @@ class DatabaseManager:
         try:
             now = datetime.now().isoformat()
             
-            conn = sqlite3.connect(self.db_path, timeout=30.0)
-            cursor = conn.cursor()
-            
-            # Get the response details first
-            cursor.execute('''
-                SELECT session_id, generated_response FROM ai_response_queue WHERE id = ?
-            ''', (queue_id,))
-            
-            row = cursor.fetchone()
-            if not row:
-                logger.error(f"AI response not found in queue", queue_id=queue_id)
-                conn.close()
-                return False
-            
-            session_id, response_content = row
-            
-            # Add approved message to session (using direct SQL to avoid connection conflicts)
-            message_id = str(uuid.uuid4())
-            cursor.execute('''
-                INSERT INTO messages (id, session_id, sender_type, content, is_ai_generated, approval_status, created_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (message_id, session_id, 'ai', response_content, True, 'approved', now))
-            
-            # Update session timestamp
-            cursor.execute('''
-                UPDATE chat_sessions SET updated_at = ? WHERE id = ?
-            ''', (now, session_id))
-            
-            # Update queue status to approved
-            cursor.execute('''
-                UPDATE ai_response_queue SET status = 'approved', approved_at = ? WHERE id = ?
-            ''', (now, queue_id))
-            
-            # Update queue to sent
-            cursor.execute('''
-                UPDATE ai_response_queue SET status = 'sent', sent_at = ? WHERE id = ?
-            ''', (now, queue_id))
-            
-            conn.commit()
-            conn.close()
+            with self.get_connection() as conn:
+                # Approval sends immediately, so mark approved and sent while reading the response
+                row = conn.execute(SQL_UPDATE_QUEUE_APPROVED_SENT, (now, now, queue_id)).fetchone()
+                if not row:
+                    logger.error(f"Pending AI response not found in queue", queue_id=queue_id)
+                    return False
+                
+                session_id, response_content = row
+                
+                # Add approved message to session (using direct SQL to avoid connection conflicts)
+                message_id = str(uuid.uuid4())
+                conn.execute(SQL_INSERT_MESSAGE, (message_id, session_id, 'ai', response_content, True, 'approved', now))
+                
+                # Update session timestamp
+                conn.execute(SQL_UPDATE_SESSION_TS, (now, session_id))
             
             duration = time.time() - start_time
             log_database_operation("APPROVE_AI_RESPONSE", "ai_response_queue", queue_id, {
@@ -435,15 +628,8 @@ class DatabaseManager:
         logger.info(f"Rejecting AI response", queue_id=queue_id)
         
         try:
-            conn = sqlite3.connect(self.db_path, timeout=30.0)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                UPDATE ai_response_queue SET status = 'rejected' WHERE id = ?
-            ''', (queue_id,))
-            
-            conn.commit()
-            conn.close()
+            with self.get_connection() as conn:
+                conn.execute(SQL_UPDATE_QUEUE_REJECTED, (queue_id,))
             
             duration = time.time() - start_time
             log_database_operation("REJECT_AI_RESPONSE", "ai_response_queue", queue_id, {
@@ -1,12 +1,23 @@
 """
 Comprehensive logging configuration for Xandy Learning AI Mentor System
 """
+import atexit
 import logging
+import logging.handlers
 import os
-from datetime import datetime
-from typing import Optional
+import queue
+from typing import Callable, Optional, Union
 import json
 
+# Log details may be passed as a zero-arg callable so they are only built when logged
+LogDetails = Union[dict, Callable[[], dict], None]
+
+def _resolve_details(details: LogDetails) -> dict:
+    """Return the details dict, calling it first if it was passed lazily"""
+    if callable(details):
+        details = details()
+    return details or {}
+
 class ColoredFormatter(logging.Formatter):
     """Custom formatter with colors for different log levels"""
     
@@ -20,12 +31,22 @@ class ColoredFormatter(logging.Formatter):
         'RESET': '\033[0m'      # Reset
     }
     
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Colored level names are built once instead of per record
+        self._colored = {
+            level: f"{color}{level}{self.COLORS['RESET']}"
+            for level, color in self.COLORS.items() if level != 'RESET'
+        }
+    
     def format(self, record):
-        # Add color to levelname
-        if record.levelname in self.COLORS:
-            record.levelname = f"{self.COLORS[record.levelname]}{record.levelname}{self.COLORS['RESET']}"
-        
-        return super().format(record)
+        # Color levelname only while formatting so other handlers see the plain name
+        original = record.levelname
+        record.levelname = self._colored.get(original, original)
+        try:
+            return super().format(record)
+        finally:
+            record.levelname = original
 
 class XandyLogger:
     """Centralized logging system for Xandy Learning"""
@@ -33,6 +54,7 @@ class XandyLogger:
     def __init__(self, name: str = "xandy_learning", log_level: str = "INFO"):
         self.logger = logging.getLogger(name)
         self.logger.setLevel(getattr(logging, log_level.upper()))
+        self.listener: Optional[logging.handlers.QueueListener] = None
         
         # Prevent duplicate handlers
         if self.logger.handlers:
@@ -50,27 +72,33 @@ class XandyLogger:
             datefmt='%H:%M:%S'
         )
         console_handler.setFormatter(console_formatter)
-        self.logger.addHandler(console_handler)
         
-        # File handler for all logs
+        # File handler for all logs, rolled over at local midnight
         os.makedirs('logs', exist_ok=True)
-        file_handler = logging.FileHandler(
-            f'logs/xandy_learning_{datetime.now().strftime("%Y%m%d")}.log'
+        file_handler = logging.handlers.TimedRotatingFileHandler(
+            'logs/xandy_learning.log', when='midnight', backupCount=14, delay=True
         )
         file_formatter = logging.Formatter(
             '%(asctime)s | %(levelname)s | %(name)s | %(funcName)s:%(lineno)d | %(message)s',
             datefmt='%Y-%m-%d %H:%M:%S'
         )
         file_handler.setFormatter(file_formatter)
-        self.logger.addHandler(file_handler)
         
         # Error file handler
-        error_handler = logging.FileHandler(
-            f'logs/errors_{datetime.now().strftime("%Y%m%d")}.log'
+        error_handler = logging.handlers.TimedRotatingFileHandler(
+            'logs/errors.log', when='midnight', backupCount=30, delay=True
         )
         error_handler.setLevel(logging.ERROR)
         error_handler.setFormatter(file_formatter)
-        self.logger.addHandler(error_handler)
+        
+        # All I/O happens on the listener thread; logging calls only enqueue
+        log_queue = queue.Queue(-1)
+        self.logger.addHandler(logging.handlers.QueueHandler(log_queue))
+        self.listener = logging.handlers.QueueListener(
+            log_queue, file_handler, error_handler, console_handler, respect_handler_level=True
+        )
+        self.listener.start()
+        atexit.register(self.listener.stop)
     
     def debug(self, message: str, **kwargs):
         """Log debug message with optional context"""
@@ -94,20 +122,28 @@ class XandyLogger:
     
     def _log_with_context(self, level: int, message: str, **kwargs):
         """Log message with additional context"""
+        # Skip JSON serialization entirely for filtered levels
+        if not self.logger.isEnabledFor(level):
+            return
+        
         if kwargs:
             context = json.dumps(kwargs, default=str)
             message = f"{message} | Context: {context}"
         
         self.logger.log(level, message)
     
-    def log_user_action(self, user_id: str, action: str, details: dict = None):
+    def log_user_action(self, user_id: str, action: str, details: LogDetails = None):
         """Log user actions for audit trail"""
-        self.info(f"User Action: {action}", user_id=user_id, details=details or {})
+        if not self.logger.isEnabledFor(logging.INFO):
+            return
+        self.info(f"User Action: {action}", user_id=user_id, details=_resolve_details(details))
     
-    def log_ai_interaction(self, mentor_id: str, student_id: str, interaction_type: str, details: dict = None):
+    def log_ai_interaction(self, mentor_id: str, student_id: str, interaction_type: str, details: LogDetails = None):
         """Log AI interactions for monitoring"""
+        if not self.logger.isEnabledFor(logging.INFO):
+            return
         self.info(f"AI Interaction: {interaction_type}", 
-                 mentor_id=mentor_id, student_id=student_id, details=details or {})
+                 mentor_id=mentor_id, student_id=student_id, details=_resolve_details(details))
     
     def log_database_operation(self, operation: str, table: str, record_id: str = None, details: dict = None):
         """Log database operations"""
@@ -121,11 +157,11 @@ class XandyLogger:
 logger = XandyLogger()
 
 # Convenience functions
-def log_user_action(user_id: str, action: str, details: dict = None):
+def log_user_action(user_id: str, action: str, details: LogDetails = None):
     """Log user action"""
     logger.log_user_action(user_id, action, details)
 
-def log_ai_interaction(mentor_id: str, student_id: str, interaction_type: str, details: dict = None):
+def log_ai_interaction(mentor_id: str, student_id: str, interaction_type: str, details: LogDetails = None):
     """Log AI interaction"""
     logger.log_ai_interaction(mentor_id, student_id, interaction_type, details)
 
@@ -0,0 +1,100 @@
+"""
+Semantic reply cache for Xandy Learning AI Mentor System
+"""
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+import google.generativeai as genai
+import numpy as np
+
+from logging_config import logger
+
+# Embedding model used to compare student messages
+EMBEDDING_MODEL = "models/text-embedding-004"
+
+# Minimum cosine similarity for two student messages to share a reply
+SIMILARITY_THRESHOLD = 0.92
+
+# Replies are only shared within one (mentor_id, style id) namespace
+CacheKey = Tuple[str, str]
+
+class SemanticCache:
+    """In-process cache of AI replies keyed by student message embeddings, namespaced per mentor style"""
+
+    def __init__(self, threshold: float = SIMILARITY_THRESHOLD, max_entries_per_namespace: int = 500,
+                 max_namespaces: int = 100):
+        self.threshold = threshold
+        self.max_entries_per_namespace = max_entries_per_namespace
+        self.max_namespaces = max_namespaces
+        self._embeddings: "OrderedDict[CacheKey, np.ndarray]" = OrderedDict()
+        self._responses: "OrderedDict[CacheKey, List[str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def embed(self, text: str) -> Optional[np.ndarray]:
+        """Return the unit-normalized embedding of a message, or None if embedding fails"""
+        try:
+            result = genai.embed_content(
+                model=EMBEDDING_MODEL,
+                content=text,
+                task_type="semantic_similarity"
+            )
+            vector = np.asarray(result["embedding"], dtype=np.float32)
+            norm = np.linalg.norm(vector)
+            if not norm:
+                return None
+            return vector / norm
+
+        except Exception as e:
+            logger.warning(f"Error embedding message for semantic cache", error=str(e))
+            return None
+
+    def lookup(self, key: CacheKey, embedding: np.ndarray) -> Optional[str]:
+        """Return a cached reply for a sufficiently similar message in the same namespace"""
+        with self._lock:
+            matrix = self._embeddings.get(key)
+            if matrix is None:
+                return None
+            self._embeddings.move_to_end(key)
+            self._responses.move_to_end(key)
+
+            # Rows are unit vectors, so the dot product is the cosine similarity
+            scores = matrix @ embedding
+            best = int(np.argmax(scores))
+            similarity = float(scores[best])
+            if similarity < self.threshold:
+                return None
+
+            logger.info(f"Semantic cache hit", mentor_id=key[0], style_id=key[1],
+                        similarity=f"{similarity:.3f}")
+            return self._responses[key][best]
+
+    def add(self, key: CacheKey, embedding: np.ndarray, response: str):
+        """Remember a reply, evicting the oldest entries and least recently used namespaces"""
+        with self._lock:
+            matrix = self._embeddings.get(key)
+            if matrix is None:
+                matrix = embedding[np.newaxis, :]
+                responses = [response]
+            else:
+                matrix = np.vstack([matrix, embedding])
+                responses = self._responses[key] + [response]
+
+            self._embeddings[key] = matrix[-self.max_entries_per_namespace:]
+            self._responses[key] = responses[-self.max_entries_per_namespace:]
+            self._embeddings.move_to_end(key)
+            self._responses.move_to_end(key)
+
+            while len(self._embeddings) > self.max_namespaces:
+                oldest, _ = self._embeddings.popitem(last=False)
+                self._responses.pop(oldest, None)
+
+    def clear(self, mentor_id: str):
+        """Drop all cached replies for a mentor, e.g. after their style changes"""
+        with self._lock:
+            for key in [key for key in self._embeddings if key[0] == mentor_id]:
+                self._embeddings.pop(key, None)
+                self._responses.pop(key, None)
+
+# Global semantic cache instance
+semantic_cache = SemanticCache()